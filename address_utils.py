@@ -0,0 +1,50 @@
+import re
+
+# Common USPS street suffix / direction abbreviations, so that
+# "123 Main Street" and "123 main st." resolve to the same cache key
+ABBREVIATIONS = {
+    "street": "st",
+    "road": "rd",
+    "avenue": "ave",
+    "boulevard": "blvd",
+    "drive": "dr",
+    "court": "ct",
+    "lane": "ln",
+    "place": "pl",
+    "parkway": "pkwy",
+    "square": "sq",
+    "terrace": "ter",
+    "highway": "hwy",
+    "circle": "cir",
+    "apartment": "apt",
+    "suite": "ste",
+    "north": "n",
+    "south": "s",
+    "east": "e",
+    "west": "w",
+    "northeast": "ne",
+    "northwest": "nw",
+    "southeast": "se",
+    "southwest": "sw",
+}
+
+
+def normalize_address(address: str) -> str:
+    """
+    Build canonical form of the address that is used as a cache key.
+
+    address (str) - free text address, i.e "18070 Langlois Road, Desert Hot Springs, CA 92241, USA"
+
+    return (str) - normalized address, i.e "18070 langlois rd, desert hot springs, ca 92241"
+    """
+    if not address:
+        return ""
+    address = address.lower().strip()
+    address = re.sub(r",?\s*(usa|united states)\s*$", "", address)
+    address = re.sub(r"[^\w\s,#]", " ", address)
+    parts = []
+    for part in address.split(","):
+        words = [ABBREVIATIONS.get(word, word) for word in part.split()]
+        if words:
+            parts.append(" ".join(words))
+    return ", ".join(parts)
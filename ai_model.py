@@ -1,16 +1,19 @@
+import asyncio
 import json
-import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 import aiohttp
 from googlemaps.exceptions import ApiError
 from pydantic import BaseModel, Field
-import requests
 import re
 import os
 from typing import Optional
 from dotenv import load_dotenv
-import googlemaps
 from langchain.agents import initialize_agent, Tool
+from langchain.agents.chat.prompt import SYSTEM_MESSAGE_SUFFIX
+from langchain.callbacks.base import BaseCallbackHandler
 from langchain.chat_models import ChatOpenAI
 from langchain.schema import AIMessage, HumanMessage, SystemMessage
 from langchain.memory import ConversationBufferMemory
@@ -18,17 +21,51 @@ from langchain.tools import GooglePlacesTool
 #from langchain.utilities.google_places_api import GooglePlacesAPIWrapper
 from datetime import datetime
 from custom_google_places import CustomGooglePlacesAPIWrapper
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+from cache import TTLCache, StaleWhileRevalidateCache
+from address_utils import normalize_address
+from rate_limiter import rapidapi_get
+from zillow_client import zillow_client
+from blocking import run_blocking
+from webhook_dispatcher import webhook_dispatcher, MAKE_WEBHOOK_URL
+from listings_index import agent_listings_index, AgentListings
+from distance_service import distances_from, is_found, display_distance
+from geocoder import geocode, ageocode
+from nearby_tiles import nearby_tiles
+from conversation_store import conversation_store
+from llm_cache import cached_call, acached_call
+from property_projection import project
+from listing_table import encode_listings
+from listing_filters import normalize_search_params
+from token_budget import MAX_CONTEXT_TOKENS, clip_messages, clip_text, message_tokens
 
 # Load .env file
 load_dotenv()
 
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 # Read an environment variable
 os.environ["GPLACES_API_KEY"] =  os.getenv('GPLACES_API_KEY')
 os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
 
+# normalized address -> zpid. Set ZPID_CACHE_PATH to keep resolved zpids between restarts
+zpid_cache = TTLCache(
+    "zpid",
+    maxsize=int(os.getenv("ZPID_CACHE_SIZE", 5000)),
+    ttl=float(os.getenv("ZPID_CACHE_TTL", 7 * 24 * 3600)),
+    negative_ttl=float(os.getenv("ZPID_CACHE_NEGATIVE_TTL", 3600)),
+    path=os.getenv("ZPID_CACHE_PATH"),
+)
+
+# zpid -> full /property document, shared by get_house_property and get_tax_informatiom
+property_cache = StaleWhileRevalidateCache(
+    "property",
+    fresh_ttl=float(os.getenv("PROPERTY_CACHE_FRESH_TTL", 15 * 60)),
+    max_age=float(os.getenv("PROPERTY_CACHE_MAX_AGE", 24 * 3600)),
+    max_bytes=int(os.getenv("PROPERTY_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+)
+
 functions = [
     {
         "name": "search_params",
@@ -106,56 +143,31 @@ functions = [
 
 def get_agent_listings(agent_id: str):
     """Tool that gets all active listings of provided agent"""
-    all_listings = []
-    page_number = 1
-    size = 5  # Number of listings per page
-    while True:
-        querystring = {"zuid": agent_id, "page": str(page_number), "size": str(size)}
-        url = "https://zillow-com1.p.rapidapi.com/agentActiveListings"
-        headers = {
-            "X-RapidAPI-Key": os.getenv("X-RapidAPI-Key"),
-            "X-RapidAPI-Host": "zillow-com1.p.rapidapi.com"
-        }
+    return agent_listings_index.get(agent_id).as_result()
 
-        time.sleep(1.5)  # To avoid hitting the API rate limit
-        response = requests.get(url, headers=headers, params=querystring)
 
-        # Safely handle the JSON response
-        lis = response.json().get("listings", [])
-        if lis:
-            all_listings.extend(lis)
+async def aget_agent_listings(agent_id: str):
+    """Async variant of get_agent_listings"""
+    return (await agent_listings_index.aget(agent_id)).as_result()
 
-        # Stop if fewer than 'size' listings are returned (indicating the last page)
-        if len(lis) < size:
-            break
-        else:
-            page_number += 1
 
-    print(f"Total listings retrieved: {len(all_listings)}")
-    
-    # Collect photos from the listings
-    photos = {
-        f'{el["address"]["line1"]}, {el["address"].get("line2", "")}': el["primary_photo_url"]
-        for el in all_listings
-        if "primary_photo_url" in el
-    }
+def _match_agent_listings(listings: AgentListings, func_result) -> list|str:
+    matched_homes = listings.match(func_result)
 
-    return {"res": all_listings, "photos": photos}
+    if matched_homes:
+        return matched_homes
+    else:
+        return "There are no matching properties in the agent's listings"
 
 
 def check_matched_properties(agent_id, func_result):
     """Check which properties from agent listings match the search result"""
-    listings_data = get_agent_listings(agent_id)
-    listings = listings_data["res"]  # Retrieve the listings from the result
-    zpids_agent = [el.get("zpid") for el in listings if el.get("zpid")]
+    return _match_agent_listings(agent_listings_index.get(agent_id), func_result)
 
-    matched_homes = [el for el in func_result if el.get("zpid") in zpids_agent]
-    
-    if matched_homes:
-        return matched_homes
-    else:
-        return "There are no matching properties in the agent's listings"
 
+async def acheck_matched_properties(agent_id, func_result):
+    """Async variant of check_matched_properties"""
+    return _match_agent_listings(await agent_listings_index.aget(agent_id), func_result)
 
 
 def convert_timestamp_to_date(timestamp):
@@ -177,7 +189,13 @@ def find_zpid(
 
     if not location:
         return "Location not provided."
-    
+
+    cache_key = normalize_address(location)
+    cached_zpid = zpid_cache.get(cache_key)
+    if cached_zpid is not None:
+        print("ZPID_CACHE_HIT: ", cache_key, cached_zpid)
+        return cached_zpid
+
     base_url = "https://zillow-com1.p.rapidapi.com/propertyExtendedSearch"
 
     headers = {
@@ -189,31 +207,55 @@ def find_zpid(
     print("LOCATION: ", location)
     print("QUERYSTRING: ", querystring)
     # print(f'Search with {querystring}')
-    time.sleep(1.3)
+    result = rapidapi_get(base_url, params=querystring, headers=headers)
+    # print("FIND_ZPID_RESULT: ", result.json())
+    try:
+        zpid = _parse_zpid(result.json())
+    except Exception as e:
+        return f"Error fetching ZPID: {str(e)}"
+    _cache_zpid(cache_key, result.status_code, zpid)
+    return zpid
 
 
-    result = requests.get(base_url, params=querystring, headers=headers)
-    # print("FIND_ZPID_RESULT: ", result.json())
+async def afind_zpid(location: Optional[str] = None) -> dict|str:
+    """Async variant of find_zpid"""
+    if not location:
+        return "Location not provided."
+
+    cache_key = normalize_address(location)
+    cached_zpid = zpid_cache.get(cache_key)
+    if cached_zpid is not None:
+        print("ZPID_CACHE_HIT: ", cache_key, cached_zpid)
+        return cached_zpid
+
     try:
-        data = result.json()
-        if isinstance(result.json(), list):
-            return data[0].get("zpid", "ZPID not found")
-        return data.get("zpid", "ZPID not found")
+        status, data = await zillow_client.get("propertyExtendedSearch", {"location": location, "page": "1"})
+        zpid = _parse_zpid(data)
     except Exception as e:
         return f"Error fetching ZPID: {str(e)}"
+    _cache_zpid(cache_key, status, zpid)
+    return zpid
 
 
-def post_process_house_property(house_property):
+def _cache_zpid(cache_key: str, status: int, zpid):
+    """Only successful responses are cached, "ZPID not found" of a 200 response for a shorter time.
+    Rate limit and server errors (429, 403, 5xx) are not cached at all"""
+    if status != 200:
+        print(f"ZPID_NOT_CACHED: status {status} for {cache_key}")
+        return
+    zpid_cache.set(cache_key, zpid, negative=zpid == "ZPID not found")
+
+
+def _parse_zpid(data) -> str:
+    if isinstance(data, list):
+        return data[0].get("zpid", "ZPID not found")
+    return data.get("zpid", "ZPID not found")
 
-    """Remove some information from zillow listing to fit into LLM's context """
-    print("HOUSE_PROPERTY_VARIABLE: ", house_property)
-    keys_to_remove = [
-        "nearbyHomes", "listed_by", "brokerageName", "contact_recipients", "priceHistory", "resoFacts", "attributionInfo", "taxHistory"
-    ]
-    for key in keys_to_remove:
-        house_property.pop(key, None) # safely remove key if exists
 
-    return house_property
+def post_process_house_property(house_property, use_case: str = "details"):
+
+    """Keep only fields of the use case (see property_projection.PROJECTIONS) to fit into LLM's context """
+    return project(house_property, use_case)
 
 
 def __get_info_about_home_from_zillow(location: str):
@@ -221,6 +263,19 @@ def __get_info_about_home_from_zillow(location: str):
     if zpid == "Sorry, could you please give full address":
         return zpid
 
+    if zpid is None:
+        raise Exception("Didn't get zpid")
+
+    # errors are returned as strings (or dicts without zpid) and are not cached
+    return property_cache.get_or_load(
+        str(zpid),
+        lambda: fetch_property_document(zpid),
+        should_cache=lambda document: isinstance(document, dict) and "zpid" in document,
+    )
+
+
+def fetch_property_document(zpid) -> dict|str:
+    """Get full /property document from Zillow api, bypassing property_cache"""
     base_url = "https://zillow-com1.p.rapidapi.com/property"
 
     headers = {
@@ -230,14 +285,9 @@ def __get_info_about_home_from_zillow(location: str):
 
     }
 
-    if zpid is not None:
-        querystring = {"zpid": f"{zpid}"}
-    else:
-        raise Exception("Didn't get zpid")
-
+    querystring = {"zpid": f"{zpid}"}
 
-    time.sleep(1.5)
-    result = requests.get(base_url, params=querystring, headers=headers)
+    result = rapidapi_get(base_url, params=querystring, headers=headers)
     print("RESULT: ", result)
     
     if result.status_code == 200:
@@ -248,16 +298,41 @@ def __get_info_about_home_from_zillow(location: str):
     else:
         return f"Error fetching data: {result.text}"
 
+
+async def afetch_property_document(zpid) -> dict|str:
+    """Async variant of fetch_property_document"""
+    try:
+        status, data = await zillow_client.get("property", {"zpid": zpid})
+    except Exception as e:
+        return f"Error fetching data: {str(e)}"
+    if status == 200 and isinstance(data, dict):
+        return data
+    return f"Error fetching data: {data}"
+
+
+async def _aget_info_about_home_from_zillow(location: str):
+    """Async variant of __get_info_about_home_from_zillow"""
+    zpid = await afind_zpid(location)
+    if zpid == "Sorry, could you please give full address":
+        return zpid
+
+    if zpid is None:
+        raise Exception("Didn't get zpid")
+
+    return await property_cache.aget_or_load(
+        str(zpid),
+        lambda: afetch_property_document(zpid),
+        should_cache=lambda document: isinstance(document, dict) and "zpid" in document,
+    )
+
 def get_house_property(
     location: Optional[str] = None,
 ) -> dict|str:
     """Tool that uses Zillow api to get house properties given adress of the house.Use case answer on questions related to the house. Valid params include "location":"location"."""
     result = __get_info_about_home_from_zillow(location)
     if isinstance(result, str):
-        webhook_url = "https://hook.us1.make.com/shkla22h4n5o0teeqvwl4x7lcoy977vs"
-        #webhook_url = "https://hooks.zapier.com/hooks/catch/15488019/3s3kzre/"
         payload = {"get_house_property": result}
-        requests.post(webhook_url, json=payload)
+        webhook_dispatcher.enqueue_threadsafe(MAKE_WEBHOOK_URL, payload)
 
         return result
     print("RESULT: ", result)
@@ -266,10 +341,18 @@ def get_house_property(
     return post_processed
 
 
+async def aget_house_property(location: Optional[str] = None) -> dict|str:
+    """Async variant of get_house_property"""
+    result = await _aget_info_about_home_from_zillow(location)
+    if isinstance(result, str):
+        webhook_dispatcher.enqueue(MAKE_WEBHOOK_URL, {"get_house_property": result})
+        return result
+    return post_process_house_property(result)
+
+
 def find_distance(addresses:str) -> str:
     '''Find distance tool, useful when need to find distance between two exact addresses'''
     splitted_addresses = addresses.split('|')
-    gmaps = googlemaps.Client(key = os.getenv('GPLACES_API_KEY'))
 
 
     if len(splitted_addresses) == 2:
@@ -282,38 +365,27 @@ def find_distance(addresses:str) -> str:
                 address2 = GooglePlacesTool(api_wrapper=CustomGooglePlacesAPIWrapper(top_k_results=1)).run(f'{address2} near {address1}').split('Address:')[1].split('\n')[0]
             except IndexError:
                 return "Sorry, couldn't find the distance"
-        data = gmaps.distance_matrix(address1,address2)
-        my_dist =data['rows'][0]['elements'][0]
-        if my_dist['status'] == 'NOT_FOUND':
+        my_dist = distances_from(address1, [address2])[0]
+        if not is_found(my_dist):
             return "Sorry, couldn't find the distance"
-        if not my_dist.get("distance"):
-            return "Sorry, couldn't find the distance"
-        distance_km = my_dist['distance']['text']
-        if distance_km == "1 m":
-            distance_km = 'less than 200 m'
-        duration = my_dist['duration']['text']
-        if data['destination_addresses'][0] == data['origin_addresses'][0]:
+        distance_km = display_distance(my_dist)
+        duration = my_dist['duration_text']
+        if my_dist['destination_address'] == my_dist['origin_address']:
             return "Ask about name of the location that user interested in"
-        res = f"Include this information while answering \n Distance from {data['destination_addresses'][0]} to {data['origin_addresses'][0]} is {distance_km} and the duration is {duration}"
+        res = f"Include this information while answering \n Distance from {my_dist['destination_address']} to {my_dist['origin_address']} is {distance_km} and the duration is {duration}"
         return res
     elif len(splitted_addresses) > 2:
         answer = ""
         address1 = splitted_addresses[0]
         try:
-            for i in range(1,len(splitted_addresses)):
-                address2 = splitted_addresses[i]
-                data = gmaps.distance_matrix(address1,address2)
-                my_dist =data['rows'][0]['elements'][0]
-                if my_dist['status'] == 'NOT_FOUND':
-                    return "Sorry, couldn't find the distance"
-                if not my_dist.get("distance"):
+            # one Distance Matrix request for all destinations
+            for my_dist in distances_from(address1, splitted_addresses[1:]):
+                if not is_found(my_dist):
                     return "Sorry, couldn't find the distance"
-                distance_km = my_dist['distance']['text']
-                if distance_km == "1 m":
-                    distance_km = 'less than 200 m'
-                duration = my_dist['duration']['text']
+                distance_km = display_distance(my_dist)
+                duration = my_dist['duration_text']
 
-                answer += f"Distance from {data['destination_addresses'][0]} to {data['origin_addresses'][0]} is {distance_km} and the duration is {duration}\n"
+                answer += f"Distance from {my_dist['destination_address']} to {my_dist['origin_address']} is {distance_km} and the duration is {duration}\n"
         except ApiError:
             return "Sorry, couldn't find the distance"
         res = f"Include this information while answering \n{answer}"
@@ -337,7 +409,6 @@ def get_info_about_similar_homes(location: str, agent_id=None):
     zpid = find_zpid(location)
     if zpid == "Sorry, could you please give full address":
         return zpid
-    time.sleep(1.5)
 
     url = "https://zillow-com1.p.rapidapi.com/similarProperty"
 
@@ -347,8 +418,9 @@ def get_info_about_similar_homes(location: str, agent_id=None):
         "X-RapidAPI-Key": os.getenv("X-RapidAPI-Key"),
         "X-RapidAPI-Host": "zillow-com1.p.rapidapi.com"
     }
-    time.sleep(1.5)
-    response = requests.get(url, headers=headers, params=querystring)
+    response = rapidapi_get(url, headers=headers, params=querystring)
+    if response.status_code != 200:
+        return f"Error fetching data: {response.text}"
     result = response.json()
     if agent_id:
         res = check_matched_properties(agent_id, result)
@@ -356,29 +428,27 @@ def get_info_about_similar_homes(location: str, agent_id=None):
     return result
 
 
-def get_info_about_nearby_homes(location:str, agent_id=None) -> str:
-    """Tool that uses Zillow api to search for nearby properties given adress of the house. Use case answer on questions related to the properties nearby. Valid params include "location":"location"."""
-    gmaps = googlemaps.Client(key=os.getenv("GPLACES_API_KEY"))
+async def aget_info_about_similar_homes(location: str, agent_id=None):
+    """Async variant of get_info_about_similar_homes"""
+    zpid = await afind_zpid(location)
+    if zpid == "Sorry, could you please give full address":
+        return zpid
 
-    geocode_result = gmaps.geocode(location)
-    coordinates = geocode_result[0]["geometry"]["location"]
-    longitude = coordinates["lng"]
-    latitude = coordinates["lat"]
-    url = "https://zillow-com1.p.rapidapi.com/propertyByCoordinates"
+    status, result = await zillow_client.get("similarProperty", {"zpid": zpid})
+    if status != 200:
+        return f"Error fetching data: {result}"
+    if agent_id:
+        return await acheck_matched_properties(agent_id, result)
+    return result
 
-    querystring = {"long": longitude, "lat": latitude, "d": "0.5", "includeSold": "false"}
 
-    headers = {
-        "X-RapidAPI-Key": os.getenv("X-RapidAPI-Key"),
-        "X-RapidAPI-Host": "zillow-com1.p.rapidapi.com"
-    }
-    time.sleep(1.5)
-    response = requests.get(url, headers=headers, params=querystring)
-    on_market_property = []
-    for element in response.json():
-        element = element.get("property")
-        if element and element["homeStatus"] != "OTHER":
-            on_market_property.append(element)
+def get_info_about_nearby_homes(location:str, agent_id=None) -> str:
+    """Tool that uses Zillow api to search for nearby properties given adress of the house. Use case answer on questions related to the properties nearby. Valid params include "location":"location"."""
+    coordinates = geocode(location)
+    if coordinates is None:
+        return "Sorry, could you please give full address"
+    # homes of the covering geohash tiles, filtered by exact distance
+    on_market_property = nearby_tiles.get(coordinates["lat"], coordinates["lng"])
     if len(on_market_property) == 0:
         return "There are no on-market properties nearby"
     if agent_id:
@@ -387,6 +457,17 @@ def get_info_about_nearby_homes(location:str, agent_id=None) -> str:
     return on_market_property
 
 
+async def aget_info_about_nearby_homes(location: str, agent_id=None) -> list|str:
+    """Async variant of get_info_about_nearby_homes"""
+    coordinates = await ageocode(location)
+    if coordinates is None:
+        return "Sorry, could you please give full address"
+    on_market_property = await nearby_tiles.aget(coordinates["lat"], coordinates["lng"])
+    if len(on_market_property) == 0:
+        return "There are no on-market properties nearby"
+    if agent_id:
+        return await acheck_matched_properties(agent_id, on_market_property)
+    return on_market_property
 
 
 def remove_data_about_dates_before_date(
@@ -404,8 +485,20 @@ def get_tax_informatiom(location: str) -> dict:
     result = __get_info_about_home_from_zillow(location)
     if isinstance(result, str):
         return result
-        print("RESULT: ", result)
-    post_processed = result["taxHistory"]
+    return _build_tax_information(result)
+
+
+async def aget_tax_informatiom(location: str) -> dict:
+    """Async variant of get_tax_informatiom"""
+    result = await _aget_info_about_home_from_zillow(location)
+    if isinstance(result, str):
+        return result
+    return _build_tax_information(result)
+
+
+def _build_tax_information(result: dict) -> list:
+    result = project(result, "tax")
+    post_processed = result.get("taxHistory", [])
     print("POST_PROCESSED: ", post_processed)
 
     # remove data, when the date was before this
@@ -419,7 +512,7 @@ def get_tax_informatiom(location: str) -> dict:
 
     post_processed = remove_data_about_dates_before_date(post_processed)
 
-    priceHistory = result["priceHistory"]
+    priceHistory = result.get("priceHistory", [])
     # remove useless data
     for i in range(len(priceHistory)):
         if "attributeSource" in priceHistory[i].keys():
@@ -431,33 +524,164 @@ def get_tax_informatiom(location: str) -> dict:
     post_processed.append(priceHistory)
 
     post_processed.append(
-        {"current_price": f"{result['price']} {result['currency']}"}
+        {"current_price": f"{result.get('price')} {result.get('currency')}"}
     )
-    post_processed.append({"propertyTaxRate": result["propertyTaxRate"]})
+    post_processed.append({"propertyTaxRate": result.get("propertyTaxRate")})
 
     return post_processed
 
 
+# "sequential": search without keywords only after the keyword search came back empty,
+# "concurrent": search with and without keywords at once and use the keyword result when it has props.
+# Concurrent saves a round trip but spends two RapidAPI requests on every search with keywords
+SEARCH_FALLBACK_MODE = os.getenv("SEARCH_FALLBACK_MODE", "sequential")
+_search_executor = ThreadPoolExecutor(max_workers=int(os.getenv("SEARCH_FALLBACK_CONCURRENCY", 4)),
+                                      thread_name_prefix="search")
+search_stats = {"searches": 0, "concurrent": 0, "keyword_hits": 0, "fallbacks": 0}
+
+
+def _has_props(result) -> bool:
+    return isinstance(result, dict) and "props" in result
+
+
+def _without_keywords(querystring: dict) -> dict:
+    querystring = dict(querystring)
+    querystring.pop("keywords", None)
+    return querystring
+
+
+def _search_zillow(querystring: dict):
+    headers = {
+        "X-RapidAPI-Key": os.getenv("X-RapidAPI-Key"),
+        "X-RapidAPI-Host": "zillow-com1.p.rapidapi.com",
+    }
+    response = rapidapi_get("https://zillow-com1.p.rapidapi.com/propertyExtendedSearch",
+                            params=querystring, headers=headers)
+    return response.json()
+
+
+def _record_search(concurrent: bool, keyword_hit: bool):
+    search_stats["searches"] += 1
+    search_stats["concurrent"] += concurrent
+    search_stats["keyword_hits" if keyword_hit else "fallbacks"] += 1
+
+
 def search_properties_without_address(user_input: str):
     """Search properties without address tool, useful when need to search properties without specific address"""
-    response = client.chat.completions.create(model="gpt-4o-mini",
-    messages=[
+    querystring = _prepare_search_querystring(extract_search_params(user_input))
+    fallback_querystring = _without_keywords(querystring)
+    concurrent = SEARCH_FALLBACK_MODE == "concurrent" and querystring != fallback_querystring
+
+    # both requests go through the same rate limiter, so the fallback doesn't break the limit
+    fallback = _search_executor.submit(_search_zillow, fallback_querystring) if concurrent else None
+    result = _search_zillow(querystring)
+    _record_search(concurrent, _has_props(result))
+    if _has_props(result):
+        # the fallback request is already running in the pool and can't be stopped, its result is dropped
+        return _search_response(result)
+
+    if querystring == fallback_querystring:
+        # there were no keywords, repeating the same search won't find anything new
+        return _search_response(result if isinstance(result, dict) else {})
+    print("NEXT_STEP: ", fallback_querystring)
+    result = fallback.result() if fallback is not None else _search_zillow(fallback_querystring)
+    return _search_response(result if isinstance(result, dict) else {}, without_keywords=True)
+
+
+async def asearch_properties_without_address(user_input: str):
+    """Async variant of search_properties_without_address"""
+    querystring = _prepare_search_querystring(await aextract_search_params(user_input))
+    fallback_querystring = _without_keywords(querystring)
+    concurrent = SEARCH_FALLBACK_MODE == "concurrent" and querystring != fallback_querystring
+
+    fallback = asyncio.ensure_future(zillow_client.get("propertyExtendedSearch", fallback_querystring)) if concurrent else None
+    try:
+        _, result = await zillow_client.get("propertyExtendedSearch", querystring)
+    except BaseException:
+        # i.e request cancelled by a newer message of the contact
+        if fallback is not None:
+            fallback.cancel()
+        raise
+    _record_search(concurrent, _has_props(result))
+    if _has_props(result):
+        if fallback is not None:
+            fallback.cancel()
+        return _search_response(result)
+
+    if querystring == fallback_querystring:
+        return _search_response(result if isinstance(result, dict) else {})
+    print("NEXT_STEP: ", fallback_querystring)
+    if fallback is None:
+        fallback = zillow_client.get("propertyExtendedSearch", fallback_querystring)
+    _, result = await fallback
+    return _search_response(result if isinstance(result, dict) else {}, without_keywords=True)
+
+
+SEARCH_PARAMS_TEMPERATURE = 0.0
+SEARCH_PARAMS_SYSTEM = "You are useful assistant"
+SEARCH_PARAMS_PROMPT = "Here is user input: {user_input}. Please return location and other parameters."
+
+
+def normalize_search_query(user_input: str) -> str:
+    """Lowercase, single spaces, no trailing punctuation, so "2 beds in Austin " and "2 beds in austin?" share params"""
+    return " ".join((user_input or "").lower().split()).strip(" .!?")
+
+
+def _search_params_key(user_input: str) -> dict:
+    # prompt templates are part of the key, so persisted params of an older prompt aren't served
+    return {"model": "gpt-4o-mini", "temperature": SEARCH_PARAMS_TEMPERATURE, "function": functions,
+            "system": SEARCH_PARAMS_SYSTEM, "prompt": SEARCH_PARAMS_PROMPT, "query": normalize_search_query(user_input)}
+
+
+def extract_search_params(user_input: str) -> dict:
+    """Extract search parameters (location, beds, price, ...) from user message with search_params function call"""
+    messages = _search_params_messages(user_input)
+
+    def call():
+        response = client.chat.completions.create(model="gpt-4o-mini",
+        messages=messages,
+        temperature=SEARCH_PARAMS_TEMPERATURE,
+        functions=functions,
+        function_call={
+            "name": "search_params"
+        })
+        return response.choices[0].message.function_call.arguments
+    # same normalized request always gets the same parameters, so repeated queries don't call OpenAI
+    return json.loads(cached_call(_search_params_key(user_input), SEARCH_PARAMS_TEMPERATURE, call))
+
+
+async def aextract_search_params(user_input: str) -> dict:
+    """Async variant of extract_search_params"""
+    messages = _search_params_messages(user_input)
+
+    async def call():
+        response = await async_client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            temperature=SEARCH_PARAMS_TEMPERATURE,
+            functions=functions,
+            function_call={"name": "search_params"},
+        )
+        return response.choices[0].message.function_call.arguments
+    return json.loads(await acached_call(_search_params_key(user_input), SEARCH_PARAMS_TEMPERATURE, call))
+
+
+def _search_params_messages(user_input: str) -> list:
+    return [
         {
             "role": "system",
-            "content": "You are useful assistant"
+            "content": SEARCH_PARAMS_SYSTEM
         },
         {
             "role": "user",
-            "content": f"Here is user input: {user_input}. Please return location and other parameters."
+            "content": SEARCH_PARAMS_PROMPT.format(user_input=user_input)
         }
-    ],
-    functions=functions,
-    function_call={
-        "name": "search_params"
-    })
-    arguments = response.choices[0].message.function_call.arguments
-
-    querystring = json.loads(arguments)
+    ]
+
+
+def _prepare_search_querystring(params: dict) -> dict:
+    """Convert search_params function call arguments into propertyExtendedSearch querystring"""
+    querystring = dict(params)
     print("QUERYSTRING: ", querystring)
     if querystring.get("keywords") and "school" in querystring.get("keywords", ""):
         key_words = ""
@@ -465,135 +689,173 @@ def search_properties_without_address(user_input: str):
             if "school" not in element:
                 key_words += f"{element}, "
         querystring["keywords"] = key_words
-    if querystring.get("minPrice") and not querystring.get("maxPrice"):
-        querystring["maxPrice"] = querystring.pop("minPrice")
-    if querystring.get("minPrice") and querystring.get("minPrice") == querystring.get("maxPrice"):
-        querystring.pop("minPrice")
-    if querystring.get("bedsMin") and not querystring.get("bedsMax"):
-        querystring["bedsMax"] = querystring.get("bedsMin")
-    elif querystring.get("bedsMax") and not querystring.get("bedsMin"):
-        querystring["bedsMin"] = querystring.get("bedsMax")
-
-    if querystring.get("bathsMin") and not querystring.get("bathsMax"):
-        querystring["bathsMax"] = querystring.get("bathsMin")
-    elif querystring.get("bathsMax") and not querystring.get("bathsMin"):
-        querystring["bathsMin"] = querystring.get("bathsMax")
+    querystring = normalize_search_params(querystring)
 
-    base_url = "https://zillow-com1.p.rapidapi.com/propertyExtendedSearch"
     for key, value in querystring.items():
         querystring[key] = str(value)
     print("ARGUMENTS: ", querystring)
+    return querystring
 
-    headers = {
-        "X-RapidAPI-Key": os.getenv("X-RapidAPI-Key"),
-        "X-RapidAPI-Host": "zillow-com1.p.rapidapi.com",
-    }
-    time.sleep(1.5)
-    result = requests.get(base_url, params=querystring, headers=headers)
-    result = result.json()
+
+def _search_response(result: dict, without_keywords: bool = False) -> dict:
+    """Format propertyExtendedSearch result for LLM and collect photos of found homes"""
     photos = {}
     if "props" not in result:
-
-        if querystring.get("keywords"):
-            querystring.pop("keywords")
-        time.sleep(1.1)
-        res = requests.get(base_url, params=querystring, headers=headers)
-        print("NEXT_STEP: ", querystring)
-        if "props" not in res.json():
-            res = "There is no result here. Ask user to specify main preferences like location, number of bedrooms, etc."
-        else:
-            result = res.json()["props"][:20]
-            print("RES_WO_KEYWORDS")
-            for element in result:
-                photos[element["address"]] = element["imgSrc"]
-
-            res = f"This is a search result{result}. Show only base info for each house."
-
-    else:
-        result = result["props"][:20]
-        for element in result:
-            photos[element["address"]] = element["imgSrc"]
-        res = f"This is a search result{result}. Show only base info for each house."
+        res = "There is no result here. Ask user to specify main preferences like location, number of bedrooms, etc."
+        return {"res": res, "photos": photos}
+    if without_keywords:
+        print("RES_WO_KEYWORDS")
+    result = result["props"][:20]
+    for element in result:
+        photos[element["address"]] = element["imgSrc"]
+    res = f"This is a search result:\n{encode_listings(result, 'property_search')}\nShow only base info for each house."
     return {"res": res, "photos": photos}
 
-class Model():
+# "two_pass": agent answer is rewritten by enhance_ai_response, "single_pass": agent writes the final answer itself
+ANSWER_MODE = os.getenv("ANSWER_MODE", "two_pass")
 
-    def __init__(self):
-        self.max_length = 16_000
+# persona and formatting rules of enhance_ai_response, applied to Final Answer in single pass mode
+SINGLE_PASS_SUFFIX = f"""{SYSTEM_MESSAGE_SUFFIX}
+Write the Final Answer as a friendly, helpful, and supportive real estate agent named Rick. You should sound like a real human. Do not mention the address in your Final Answer, instead use words like "The house", "property", etc. If the user's message is something like "I am interested in (address)" just ask what could you help him with. You must mention the tools that were used to get information."""
 
-        class SearchInput(BaseModel):
-            query: str = Field(
-                description="should be an address in similar to this format 18070 Langlois Rd SPACE 212, Desert Hot Springs, CA 92241"
-            )
 
-        get_house_details_tool = Tool(
-            name="Get House Details Tool",
-            func=get_house_property,
-            description="useful when need to search for info about house, but not about places near it.  The input to this tool should be an address of the house",
-            args_schema=SearchInput,
-        )
+def build_agent(single_pass: bool = False):
+    """Build tools, LLM client and agent executor. Executor has no memory, Model attaches its own.
 
-        find_properties_without_address_tool = Tool(
-            name="Find properties without address",
-            func=search_properties_without_address,
-            description="useful when need to find properties and don't have a full address. The input to this tool shoul be user message+address",
+    single_pass (bool) - put persona rules into the agent prompt, so its Final Answer doesn't need enhance_ai_response
+    """
+    class SearchInput(BaseModel):
+        query: str = Field(
+            description="should be an address in similar to this format 18070 Langlois Rd SPACE 212, Desert Hot Springs, CA 92241"
         )
 
-        find_distance_tool = Tool(
-            name="Find distance tool",
-            func=find_distance,
-            description="useful when need to find distance between two addresses or how close two addresses are. You may use google_places tool to find address. The input to this tool should be a | separated list of addresses of length two, representing the two addresses you want to find distance between. For example, `13545 Cielo Azul Way, Desert Hot Springs, CA 92240|12105 Palm Dr, Desert Hot Springs, CA 92240` would be the input if you wanted to find distance between 13545 Cielo Azul Way, Desert Hot Springs, CA 92240 and 12105 Palm Dr, Desert Hot Springs, CA 92240.",
-        )
+    get_house_details_tool = Tool(
+        name="Get House Details Tool",
+        func=get_house_property,
+        description="useful when need to search for info about house, but not about places near it.  The input to this tool should be an address of the house",
+        args_schema=SearchInput,
+    )
 
-        find_nearby_homes = Tool(
-            name="Find nearby homes",
-            func=get_info_about_nearby_homes,
-            description="useful when need to search for info about other houses with status On Sale, that are listed and located in specific address, but not about places near it.  The input to this tool should be an address of the house",
-        )
+    find_properties_without_address_tool = Tool(
+        name="Find properties without address",
+        func=search_properties_without_address,
+        description="useful when need to find properties and don't have a full address. The input to this tool shoul be user message+address",
+    )
 
-        get_tax_or_price_info = Tool(
-            name="Get tax or price info",
-            func=get_tax_informatiom,
-            description="useful when need to search about tax or price history, reductions info about house.  The input to this tool should be an address of the house",
-        )
+    find_distance_tool = Tool(
+        name="Find distance tool",
+        func=find_distance,
+        description="useful when need to find distance between two addresses or how close two addresses are. You may use google_places tool to find address. The input to this tool should be a | separated list of addresses of length two, representing the two addresses you want to find distance between. For example, `13545 Cielo Azul Way, Desert Hot Springs, CA 92240|12105 Palm Dr, Desert Hot Springs, CA 92240` would be the input if you wanted to find distance between 13545 Cielo Azul Way, Desert Hot Springs, CA 92240 and 12105 Palm Dr, Desert Hot Springs, CA 92240.",
+    )
 
-        google_places = Tool(
-            name="google_places",
-            func=google_places_wrapper,
-            description="""A wrapper around Google Places. 
+    find_nearby_homes = Tool(
+        name="Find nearby homes",
+        func=get_info_about_nearby_homes,
+        description="useful when need to search for info about other houses with status On Sale, that are listed and located in specific address, but not about places near it.  The input to this tool should be an address of the house",
+    )
+
+    get_tax_or_price_info = Tool(
+        name="Get tax or price info",
+        func=get_tax_informatiom,
+        description="useful when need to search about tax or price history, reductions info about house.  The input to this tool should be an address of the house",
+    )
+
+    google_places = Tool(
+        name="google_places",
+        func=google_places_wrapper,
+        description="""A wrapper around Google Places. 
         Useful for when you need to find address of some place near property
         discover addressed from ambiguous text or validate address.
         Input should be a search query.""",
-        )
+    )
 
 
 
-        tools = [get_house_details_tool, find_properties_without_address_tool, google_places, find_distance_tool,find_nearby_homes,get_tax_or_price_info]
+    tools = [get_house_details_tool, find_properties_without_address_tool, google_places, find_distance_tool,find_nearby_homes,get_tax_or_price_info]
+
+    llm = ChatOpenAI(temperature=0.0,openai_api_key=os.getenv('OPENAI_API_KEY'),max_tokens=512,model="gpt-4o-mini")
+
+
+    def _handle_error(error) -> str:
+        _, though = str(error).split("Could not parse LLM output:")
+        return though
+
+    agent_chain = initialize_agent(
+        tools,
+        llm,
+        agent="chat-zero-shot-react-description",
+        verbose=True,
+        early_stopping_method="generate",
+        max_iterations=4,
+        handle_parsing_errors=_handle_error,
+        agent_kwargs={
+            "system_message_prefix": "Answer to the question as best and comprehensively as possible, give a complete answer to the question. Inlude all important information in your Final Answer. You have access to the following tools:",
+            "system_message_suffix": SINGLE_PASS_SUFFIX if single_pass else SYSTEM_MESSAGE_SUFFIX,
+        },
+    )
+    # agent_chain.agent.llm_chain.prompt.messages[0].prompt.template = agent_chain.agent.llm_chain.prompt.messages[0].prompt.template.replace('Thought: I now know the final answer','Thought:  I have gathered detailed information to answer the question')
+    print("Prompt ", agent_chain.agent.llm_chain.prompt.messages)
+    return agent_chain
+
+
+_shared_agents = {}
 
-        self.memory = ConversationBufferMemory(memory_key="chat_history")
-        llm = ChatOpenAI(temperature=0.0,openai_api_key=os.getenv('OPENAI_API_KEY'),max_tokens=512,model="gpt-4o-mini")
-
-
-        def _handle_error(error) -> str:
-            _, though = str(error).split("Could not parse LLM output:")
-            return though
-
-        self.agent_chain = initialize_agent(
-            tools,
-            llm,
-            memory=self.memory,
-            agent="chat-zero-shot-react-description",
-            verbose=True,
-            early_stopping_method="generate",
-            max_iterations=4,
-            handle_parsing_errors=_handle_error,
-            agent_kwargs={
-                "system_message_prefix": "Answer to the question as best and comprehensively as possible, give a complete answer to the question. Inlude all important information in your Final Answer. You have access to the following tools:",
-            },
-        )
-        # self.agent_chain.agent.llm_chain.prompt.messages[0].prompt.template = self.agent_chain.agent.llm_chain.prompt.messages[0].prompt.template.replace('Thought: I now know the final answer','Thought:  I have gathered detailed information to answer the question')
-        print("Prompt ", self.agent_chain.agent.llm_chain.prompt.messages)
 
+def get_shared_agent(single_pass: bool = False):
+    """Agent executor that is built once per process (per answer mode) and shared by all Model instances"""
+    if single_pass not in _shared_agents:
+        _shared_agents[single_pass] = build_agent(single_pass)
+    return _shared_agents[single_pass]
+
+
+def is_single_pass(answer_mode: Optional[str] = None) -> bool:
+    return (answer_mode or ANSWER_MODE) == "single_pass"
+
+
+class ToolProgressHandler(BaseCallbackHandler):
+    """Forwards agent tool calls (made in a worker thread) to an asyncio queue as progress events"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+        self.loop = loop
+        self.queue = queue
+
+    def on_agent_action(self, action, **kwargs):
+        event = {"event": "tool", "tool": action.tool, "input": str(action.tool_input)}
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+
+class Model():
+
+    def __init__(self, shared_agent=None):
+        self.max_tokens = MAX_CONTEXT_TOKENS
+        if shared_agent is None:
+            shared_agent = get_shared_agent()
+        self.memory = ConversationBufferMemory(memory_key="chat_history")
+        # shallow copy without validation: tools, LLM client and prompt are shared, only memory is per Model
+        self.agent_chain = shared_agent.copy(update={"memory": self.memory})
+        self._single_pass_chain = None
+        # set when an agent run was cancelled while its thread may still write into self.memory
+        self.orphaned = False
+
+    async def run_agent(self, agent_chain, user_input, **kwargs):
+        """Run agent in the blocking pool. Cancelling only stops waiting for the thread, the agent keeps
+        writing into memory, so such Model must not go back to the pool"""
+        try:
+            return await run_blocking(agent_chain.run, user_input, **kwargs)
+        except asyncio.CancelledError:
+            self.orphaned = True
+            raise
+
+    @property
+    def single_pass_chain(self):
+        """Agent that writes the final answer in persona itself, created on first use"""
+        if self._single_pass_chain is None:
+            self._single_pass_chain = get_shared_agent(single_pass=True).copy(update={"memory": self.memory})
+        return self._single_pass_chain
+
+    def reset(self):
+        """Forget conversation, so instance can be reused for another request"""
+        self.memory.clear()
 
     def split_messages(self,text, contact_name):
         """Function to split chat history and return them as two separete lists. Last user message is skipped."""
@@ -613,6 +875,13 @@ class Model():
 
         return user_messages, ai_messages
 
+    def conversation_messages(self, message_history, contact_name, contact_id=None, history_delta=None, history_offset=None):
+        """Same as split_messages, but reuses turns already parsed for the contact (see conversation_store)"""
+        if not contact_id:
+            return self.split_messages(message_history, contact_name)
+        turns = conversation_store.turns(contact_id, contact_name, message_history, history_delta, history_offset)
+        return [turn[0] for turn in turns], [turn[1] for turn in turns]
+
     def add_memory(self, user_messages, ai_messages):
         """Add memory into LLM agent"""
         # system_prompt = "Please answer as a pirate, add 'Arr' in your messages"
@@ -635,26 +904,96 @@ class Model():
         return previous_human_messages, previous_ai_messages
 
 
-    async def response(self,user_input,message_history, contact_name):
-        """Repsond on user's message"""
-        user_messages, ai_messages = self.split_messages(message_history, contact_name)
+    async def response(self,user_input,message_history, contact_name, contact_id=None, history_delta=None, single_pass=None,
+                       history_offset=None):
+        """Repsond on user's message. single_pass skips enhance_ai_response (defaults to ANSWER_MODE)"""
+        user_messages, ai_messages = self.conversation_messages(
+            message_history, contact_name, contact_id, history_delta, history_offset
+        )
         previous_human_messages, previous_ai_messages = self.add_memory(user_messages, ai_messages)
         #remove first AI and user message if it doesn't fit into memory
 
         self.clip_context()
         print("User question: ", user_input)
-        ai_response = self.agent_chain.run(user_input)
+        if single_pass is None:
+            single_pass = is_single_pass()
+        if single_pass:
+            ai_response = await self.run_agent(
+                self.single_pass_chain, self._single_pass_input(user_input, previous_human_messages, previous_ai_messages)
+            )
+            print('Langchain single pass answer ', ai_response)
+            return ai_response
+        ai_response = await self.run_agent(self.agent_chain, user_input)
 
         print('Langchain answer ', ai_response)
         print("SELF_MEMORY: ", self.memory)
         print("PREVIOUS_USER: ", previous_human_messages)
         print("PREVIOUS_AI: ", previous_ai_messages)
-        return self.enhance_ai_response(user_input,ai_response,previous_human_messages, previous_ai_messages)
+        return await run_blocking(self.enhance_ai_response, user_input, ai_response, previous_human_messages, previous_ai_messages)
+
+    async def astream_response(self, user_input, message_history, contact_name, progress=False,
+                               contact_id=None, history_delta=None, single_pass=None, history_offset=None):
+        """
+        Streaming variant of response. Yields events:
+            {"event": "tool", "tool": ..., "input": ...} - agent called a tool (only if progress is True)
+            {"event": "token", "text": ...} - next piece of the enhanced answer
+            {"event": "done", "text": ...} - full enhanced answer
+        """
+        user_messages, ai_messages = self.conversation_messages(
+            message_history, contact_name, contact_id, history_delta, history_offset
+        )
+        previous_human_messages, previous_ai_messages = self.add_memory(user_messages, ai_messages)
+        self.clip_context()
+        print("User question: ", user_input)
 
-    def history_add(self, message_history, contact_name):
+        callbacks = []
+        queue = asyncio.Queue()
+        if progress:
+            callbacks.append(ToolProgressHandler(asyncio.get_running_loop(), queue))
+        if single_pass is None:
+            single_pass = is_single_pass()
+        if single_pass:
+            agent_chain = self.single_pass_chain
+            agent_input = self._single_pass_input(user_input, previous_human_messages, previous_ai_messages)
+        else:
+            agent_chain, agent_input = self.agent_chain, user_input
+        agent_run = asyncio.ensure_future(self.run_agent(agent_chain, agent_input, callbacks=callbacks))
+        try:
+            while not agent_run.done():
+                # tool events arrive while the agent is still running
+                queue_get = asyncio.ensure_future(queue.get())
+                await asyncio.wait([agent_run, queue_get], return_when=asyncio.FIRST_COMPLETED)
+                if queue_get.done():
+                    yield queue_get.result()
+                else:
+                    queue_get.cancel()
+            while not queue.empty():
+                yield queue.get_nowait()
+            ai_response = agent_run.result()
+        finally:
+            agent_run.cancel()
+        print('Langchain answer ', ai_response)
+        if single_pass:
+            # agent answer is final already
+            yield {"event": "token", "text": ai_response}
+            yield {"event": "done", "text": ai_response}
+            return
+
+        llm = ChatOpenAI(temperature=0.7, max_tokens=450, model="gpt-4o-mini", streaming=True)
+        messages = self._enhance_messages(user_input, ai_response, previous_human_messages, previous_ai_messages)
+        refined_response = ""
+        async for chunk in llm.astream(messages):
+            if chunk.content:
+                refined_response += chunk.content
+                yield {"event": "token", "text": chunk.content}
+        yield {"event": "done", "text": refined_response}
+
+    def history_add(self, message_history, contact_name, contact_id=None, history_delta=None, history_offset=None):
         print("MESAGE_HISTORY: ", message_history)
 
-        user_messages, ai_messages = self.split_messages(message_history, contact_name)
+        user_messages, ai_messages = self.conversation_messages(
+            message_history, contact_name, contact_id, history_delta, history_offset
+        )
         previous_human_messages, previous_ai_messages = self.add_memory(
             user_messages, ai_messages
         )
@@ -668,13 +1007,31 @@ class Model():
             for human_message, ai_message in zip(previous_human_messages, previous_ai_messages):
                 messages.append(HumanMessage(content=human_message))
                 messages.append(AIMessage(content=ai_message))
+        clip_messages(messages, self.max_tokens)
         return messages
 
 
     def enhance_ai_response(self,user_input,rough_ai_response,previous_human_messages, previous_ai_messages):
         """Additional ChatGPT request to enhance AI response"""
         llm = ChatOpenAI(temperature=0.7,max_tokens=450,model="gpt-4o-mini")
+        messages = self._enhance_messages(user_input, rough_ai_response, previous_human_messages, previous_ai_messages)
+        refined_response = llm(messages).content
+        # print("PREVIOUS_HUMAN: ", previous_human_messages)
+        # print("PREVIOUS_AI: ", previous_ai_messages)
+        # print("enhanced response ", refined_response)
+        return refined_response
 
+    def _single_pass_input(self, user_input, previous_human_messages, previous_ai_messages):
+        """Agent input in single pass mode. The agent prompt has no chat history, so the last turn
+        (the same context enhance_ai_response gets) is put in front of the user message"""
+        if not previous_human_messages or not previous_ai_messages:
+            return user_input
+        return (f"Previous user message: {previous_human_messages[-1]}\n"
+                f"Previous answer: {previous_ai_messages[-1]}\n"
+                f"User message: {user_input}")
+
+    def _enhance_messages(self, user_input, rough_ai_response, previous_human_messages, previous_ai_messages):
+        """Prompt of enhance_ai_response"""
         messages = [
             SystemMessage(
                 content=f""" You are a friendly, helpful, and supportive real estate agent named Rick. Provide the information below in enhanced format. You should sound like a real human. Do not mention the address in your response, instead use words like "The house", "property", etc. Do not mention the address. If the user's message is something like "I am interested in (address)" just ask what could you help him with. You must mention the tools that were used to get information.
@@ -693,22 +1050,15 @@ class Model():
         print("MESSAGES: ", messages)
         print("PREVIOUS_USER: ", previous_human_messages)
         print("PREVIOUS_AI: ", previous_ai_messages)
-        refined_response = llm(messages).content
-        # print("PREVIOUS_HUMAN: ", previous_human_messages)
-        # print("PREVIOUS_AI: ", previous_ai_messages)
-        # print("enhanced response ", refined_response)
-        return refined_response
+        return messages
 
     def get_content_length(self):
-        total_length = 0
-        for message in self.memory.chat_memory.messages:
-            total_length += len(message.content)
-        return total_length
+        """Tokens in agent memory"""
+        return sum(message_tokens(message) for message in self.memory.chat_memory.messages)
 
     def clip_context(self):
-        while self.get_content_length() > self.max_length:
-            self.memory.chat_memory.messages.pop(0)
-            self.memory.chat_memory.messages.pop(0)
+        """Remove oldest messages from memory until it fits into max_tokens"""
+        clip_messages(self.memory.chat_memory.messages, self.max_tokens)
 
 
     def get_summary_of_conversation(self,conversation):
@@ -721,7 +1071,7 @@ Here write text using [INSTRUCTION_1].
 Write the questions on which AI didn't was nat able to response using [INSTRUCTION_2].
 DON'T BE REPETITIVE!
 """
-        conversation = conversation[:self.max_length]
+        conversation = clip_text(conversation, self.max_tokens)
         prompt = f'{prefix} \n {conversation} \n {sufix}'
         print("PROMPT: ", prompt)
         messages =[
@@ -731,3 +1081,51 @@ DON'T BE REPETITIVE!
         print("SUMMARY_1: ", summary)
 
         return summary
+
+
+class ModelPool():
+    """Pool of ready to use Model instances, so requests don't build agents.
+
+    Usage:
+        with model_pool.model() as chatmodel:
+            ...
+    """
+
+    def __init__(self, max_idle: int = 32):
+        self.max_idle = max_idle
+        self._idle = deque()
+        self.created = 0
+        self.reused = 0
+        self.dropped = 0
+
+    def acquire(self) -> Model:
+        try:
+            model = self._idle.pop()
+            self.reused += 1
+        except IndexError:
+            model = Model()
+            self.created += 1
+        return model
+
+    def release(self, model: Model):
+        if model.orphaned:
+            # its cancelled agent run may still be writing into memory, don't give it to another contact
+            self.dropped += 1
+            return
+        model.reset()
+        if len(self._idle) < self.max_idle:
+            self._idle.append(model)
+
+    @contextmanager
+    def model(self):
+        model = self.acquire()
+        try:
+            yield model
+        finally:
+            self.release(model)
+
+    def stats(self) -> dict:
+        return {"idle": len(self._idle), "created": self.created, "reused": self.reused, "dropped": self.dropped}
+
+
+model_pool = ModelPool(max_idle=int(os.getenv("MODEL_POOL_SIZE", 32)))
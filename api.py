@@ -1,29 +1,47 @@
 import asyncio
 import datetime
+import json
 import re
 
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Literal, Optional, get_args
 
-import aiohttp
 import requests
 import os
 from langchain.chat_models import ChatOpenAI
 from langchain.schema import SystemMessage, HumanMessage
 from dotenv import load_dotenv
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from asyncio import Task
-from ai_model import (Model,
-                      get_tax_informatiom,
+from ai_model import (Model, model_pool, get_shared_agent, is_single_pass,
+                      aget_tax_informatiom,
                       google_places_wrapper,
-                      get_info_about_nearby_homes,
-                      search_properties_without_address,
-                      get_house_property, find_distance, get_info_about_similar_homes, get_agent_listings)
+                      aget_info_about_nearby_homes,
+                      asearch_properties_without_address, search_stats,
+                      aget_house_property, find_distance, aget_info_about_similar_homes, aget_agent_listings,
+                      aextract_search_params, zpid_cache, property_cache)
 from realtor_tools import (realtor_search_properties_without_address,
                            get_tax_and_price_information_from_realtor,
                            realtor_get_house_details)
-from utils import add_distance_to_google_places,get_nearby_places
-from ghl_api import get_ghl_location_id
+from utils import add_distance_to_google_places,get_nearby_places,places_stats
+from property_projection import projections_stats
+from listing_table import encode_listings, listing_tables_stats
+from ghl_api import start_ghl_location_lookup, location_id_cache, close_session as close_ghl_session
+from rate_limiter import limiter_stats
+from zillow_client import zillow_client
+from listings_index import agent_listings_index
+from custom_google_places import place_details_cache
+from geocoder import geocode_cache
+from nearby_tiles import nearby_tiles
+from listing_filters import rank_listings
+from blocking import run_blocking, executor_stats
+from task_registry import agent_tasks, contact_key
+from conversation_store import conversation_store
+from llm_cache import acached_chat, llm_cache_stats
+from place_extractor import extract_places, MIN_CONFIDENCE as PLACE_EXTRACTOR_MIN_CONFIDENCE
+from distance_service import distance_stats
+from webhook_dispatcher import webhook_dispatcher, MAKE_WEBHOOK_URL, GHL_SUMMARY_WEBHOOK_URL
 
 # Load .env file
 load_dotenv()
@@ -34,12 +52,59 @@ os.environ["OPENAI_API_KEY"] = os.getenv('OPENAI_API_KEY')
 os.environ["GPLACES_API_KEY"] = os.getenv('GPLACES_API_KEY')
 os.environ["GHL_API_KEY"] = os.getenv('GHL_API_KEY')
 
+LISTING_CANDIDATES = int(os.getenv("LISTING_CANDIDATES", 5))
+
 app = FastAPI()
 
-current_request_task = None
+
+@app.on_event("startup")
+async def build_shared_agent():
+    # tools, LLM client and agent prompt are built once, requests only get a Model from the pool.
+    # customData.answer_mode can pick either mode per request, so both agents are built
+    await asyncio.gather(run_blocking(get_shared_agent, False), run_blocking(get_shared_agent, True))
+    await webhook_dispatcher.start()
+
+
+@app.on_event("shutdown")
+async def close_clients():
+    await webhook_dispatcher.stop()
+    await zillow_client.close()
+    await close_ghl_session()
+
+
+def conversation_params(res: dict) -> dict:
+    """contact_id, optional message_history_delta (only new part of the history) and its offset in the full history"""
+    custom_data = res.get("customData") or {}
+    offset = custom_data.get("message_history_offset")
+    return {
+        "contact_id": custom_data.get("contact_id"),
+        "history_delta": custom_data.get("message_history_delta"),
+        "history_offset": int(offset) if offset is not None else None,
+    }
+
+
+AnswerMode = Literal["single_pass", "two_pass"]
+
+
+def single_pass_param(res: dict) -> Optional[bool]:
+    """customData.answer_mode of the request ("single_pass" or "two_pass"), None falls back to ANSWER_MODE"""
+    answer_mode = (res.get("customData") or {}).get("answer_mode")
+    if answer_mode is None:
+        return None
+    if answer_mode not in get_args(AnswerMode):
+        raise HTTPException(status_code=422, detail=f"customData.answer_mode must be one of {get_args(AnswerMode)}")
+    return is_single_pass(answer_mode)
+
+
+async def pooled_model():
+    """FastAPI dependency that borrows Model from the pool for the duration of request"""
+    with model_pool.model() as chatmodel:
+        yield chatmodel
 
 llm = ChatOpenAI(temperature=0.7, max_tokens=500, model="gpt-4o-mini")
 llm_gpt_4 = ChatOpenAI(temperature=0.3, max_tokens=500, model="gpt-4o-mini")
+# deterministic helper prompts (place extraction, address checks), answers are cached in llm_cache
+llm_helper = ChatOpenAI(temperature=0.0, max_tokens=500, model="gpt-4o-mini")
 
 
 # Define the schema for the request body
@@ -53,6 +118,7 @@ class CustomData(BaseModel):
     contact_name: str = Field(..., description="The name of the contact person")
     contact_id: Optional[str] = Field(None, description="The unique ID of the contact, if available")
     location: Optional[str] = Field(None, description="The location of the property or user, if available")
+    answer_mode: Optional[AnswerMode] = Field(None, description="'single_pass' or 'two_pass', defaults to ANSWER_MODE")
 
 # Define the schema for the request body
 class RequestBody(BaseModel):
@@ -62,11 +128,7 @@ class RequestBody(BaseModel):
 
 
 @app.post('/send_message_to_ai')
-async def send_message_to_ai(request: Request):
-    chatmodel = Model()
-    global current_request_task
-    if current_request_task and not current_request_task.done():
-        current_request_task.cancel()
+async def send_message_to_ai(request: Request, chatmodel: Model = Depends(pooled_model)):
     try:
         res = await request.json()
         user_message = res['customData']['message']
@@ -87,66 +149,125 @@ async def send_message_to_ai(request: Request):
         # Construct the user query including the address
         user_query = f'{user_message} I am interested in {address}'
 
-        current_request_task = asyncio.create_task(chatmodel.response(user_query, message_history, contact_name))
-        ai_response = await current_request_task
-        # ai_response = current_request_task.result()
+        # new message of the same contact cancels its older run only
+        request_task = agent_tasks.start(
+            contact_key(res), chatmodel.response(
+                user_query, message_history, contact_name, single_pass=single_pass_param(res), **conversation_params(res)
+            )
+        )
+        ai_response = await request_task
         print("BOT_RESPONSE:", ai_response)
         # ai_response = chatmodel.response(user_query, message_history)
         ## make post request on GHL's inbound webhook
-        async with aiohttp.ClientSession() as session:
-            webhook_url = "https://hook.us1.make.com/shkla22h4n5o0teeqvwl4x7lcoy977vs"
-            #webhook_url = "https://hooks.zapier.com/hooks/catch/15488019/3s3kzre/"
-            #webhook_url = 'https://services.leadconnectorhq.com/hooks/Cr4I5rLHxAhYI19SvpP6/webhook-trigger/f15fe780-1831-47de-8bfd-9241b8ac626c'
-            payload = {'bot_response': ai_response, 'phone': phone, 'email': email, "contact_id": contact_id}
-            async with session.post(webhook_url, json=payload) as response:
-                pass
+        payload = {'bot_response': ai_response, 'phone': phone, 'email': email, "contact_id": contact_id}
+        webhook_dispatcher.enqueue(MAKE_WEBHOOK_URL, payload)
         return {'bot_response': ai_response}
     except asyncio.CancelledError:
         pass
-    finally:
-        current_request_task = None
+
+
+def sse_event(event: dict) -> str:
+    """Server-sent event with JSON payload"""
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+
+@app.post('/send_message_to_ai/stream')
+async def send_message_to_ai_stream(request: Request, progress: bool = False):
+    """Streaming variant of /send_message_to_ai. Emits SSE events: tool (with ?progress=true), token and done"""
+    res = await request.json()
+    user_message = res['customData']['message']
+    address = res['customData'].get('address', '')
+    email = res.get('email')
+    phone = res.get('phone')
+    if not address:
+        return {'prompt': 'Please provide the address you are interested in.'}
+
+    message_history = res['customData'].get('message_history', '')
+    contact_name = res["customData"].get("contact_name")
+    if not contact_name:
+        # history is split on "<contact_name>:", an empty name would split on every colon
+        raise HTTPException(status_code=422, detail="customData.contact_name is required")
+    contact_id = res.get("customData").get("contact_id")
+    user_query = f'{user_message} I am interested in {address}'
+    history_params = conversation_params(res)
+    single_pass = single_pass_param(res)
+
+    async def events():
+        # model is taken inside the generator, so it stays borrowed until the stream ends
+        with model_pool.model() as chatmodel:
+            queue = asyncio.Queue()
+
+            async def produce():
+                async for event in chatmodel.astream_response(user_query, message_history, contact_name, progress=progress,
+                                                              single_pass=single_pass, **history_params):
+                    await queue.put(event)
+
+            # same as /send_message_to_ai, a new message of the contact supersedes this run
+            run = agent_tasks.start(contact_key(res), produce())
+            ai_response = ""
+            try:
+                while not (run.done() and queue.empty()):
+                    queue_get = asyncio.ensure_future(queue.get())
+                    await asyncio.wait([run, queue_get], return_when=asyncio.FIRST_COMPLETED)
+                    if not queue_get.done():
+                        queue_get.cancel()
+                        continue
+                    event = queue_get.result()
+                    if event["event"] == "done":
+                        ai_response = event["text"]
+                    yield sse_event(event)
+                if run.cancelled():
+                    yield sse_event({"event": "superseded"})
+                    return
+                run.result()
+            except Exception as e:
+                # tell the client the answer failed, instead of closing the stream like an empty answer
+                print(f"STREAM_ERROR: {e!r}")
+                yield sse_event({"event": "error", "message": str(e)})
+                return
+            finally:
+                # client disconnected or run superseded
+                run.cancel()
+        print("BOT_RESPONSE:", ai_response)
+        payload = {'bot_response': ai_response, 'phone': phone, 'email': email, "contact_id": contact_id}
+        webhook_dispatcher.enqueue(MAKE_WEBHOOK_URL, payload)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 
 @app.post('/get_summary')
-async def get_summary(request:Request):
-    chatmodel = Model()
+async def get_summary(request:Request, chatmodel: Model = Depends(pooled_model)):
     res = await request.json()
     email = res.get("email")
     phone = res.get("phone")
+    # Get location ID from GHL while the endpoint does its own work
+    location_task = start_ghl_location_lookup(email, phone)
     message_history = res["customData"]["message_history"]
-    summary = chatmodel.get_summary_of_conversation(message_history)
-    
-
-    # Get location ID from GHL
-    location_id = await get_ghl_location_id(email, phone)
+    summary = await run_blocking(chatmodel.get_summary_of_conversation, message_history)
 
    # summary = f"{summary}"
-    async with aiohttp.ClientSession() as session:
-        webhook_url = 'https://services.leadconnectorhq.com/hooks/Cr4I5rLHxAhYI19SvpP6/webhook-trigger/f15fe780-1831-47de-8bfd-9241b8ac626c'
-        payload = {'summary': summary, 'phone': phone, 'email': email, 'location_id': location_id}
-        async with session.post(webhook_url, json=payload) as response:
-            pass
+    location_id = await location_task
+    payload = {'summary': summary, 'phone': phone, 'email': email, 'location_id': location_id}
+    webhook_dispatcher.enqueue(GHL_SUMMARY_WEBHOOK_URL, payload)
     return {'summary': summary}
 
 
 @app.post("/get_tax_or_price_info")
-async def get_tax_or_price_info(request: Request):
-    chatmodel = Model()
+async def get_tax_or_price_info(request: Request, chatmodel: Model = Depends(pooled_model)):
     res = await request.json()
     email = res.get("email")
     phone = res.get("phone")
+    # Get location ID from GHL while the endpoint does its own work
+    location_task = start_ghl_location_lookup(email, phone)
 
     user_message = res["customData"]["message"]
     address = res["customData"].get("address", "")
     message_history = res["customData"].get("message_history", "")
     contact_name = res["customData"]["contact_name"]
     contact_id = res.get("customData").get("contact_id")
-    messages = chatmodel.history_add(message_history, contact_name)
+    messages = chatmodel.history_add(message_history, contact_name, **conversation_params(res))
 
-    # Get location ID from GHL
-    location_id = await get_ghl_location_id(email, phone)
-
-    res = get_tax_informatiom(address)
+    res = await aget_tax_informatiom(address)
     messages.append(SystemMessage(
             content=f"""Your role is to provide assistance with a human touch, akin to a helpful companion supporting a real estate agent. Aim for a conversational and friendly tone.
 
@@ -156,25 +277,22 @@ async def get_tax_or_price_info(request: Request):
 """
         )
     )
-    result = llm(messages).content
-
-    async with aiohttp.ClientSession() as session:
-        webhook_url = "https://hook.us1.make.com/shkla22h4n5o0teeqvwl4x7lcoy977vs"
-        #webhook_url = "https://hooks.zapier.com/hooks/catch/15488019/3s3kzre/"
-        payload = {"bot_response": result, "phone": phone, "email": email, "contact_id": contact_id, "location_id": location_id}
+    result = (await run_blocking(llm, messages)).content
 
-        async with session.post(webhook_url, json=payload) as response:
-            pass
+    location_id = await location_task
+    payload = {"bot_response": result, "phone": phone, "email": email, "contact_id": contact_id, "location_id": location_id}
+    webhook_dispatcher.enqueue(MAKE_WEBHOOK_URL, payload)
 
     return {"bot_response": result}
 
 
 @app.post("/google_places")
-async def google_places(request: Request):
-    chatmodel = Model()
+async def google_places(request: Request, chatmodel: Model = Depends(pooled_model)):
     res = await request.json()
     email = res.get("email")
     phone = res.get("phone")
+    # Get location ID from GHL while the endpoint does its own work
+    location_task = start_ghl_location_lookup(email, phone)
     address = res["customData"].get("address", "")
 
     user_message = res["customData"]["message"]
@@ -184,9 +302,6 @@ async def google_places(request: Request):
     contact_name = res["customData"]["contact_name"]
     print("USER_QUERY: ", user_query)
 
-    # Get location ID from GHL
-    location_id = await get_ghl_location_id(email, phone)
-
     city_state = address.split(",")
     print("FIRST_SPLIT_ADDRESS: ", city_state)
     if len(city_state) > 2:
@@ -210,12 +325,9 @@ async def google_places(request: Request):
             "It seems like I don't have the address. Could you please provide the location you're asking about? "
             "That way I can find nearby places for you."
         )
-        async with aiohttp.ClientSession() as session:
-            webhook_url = "https://hook.us1.make.com/shkla22h4n5o0teeqvwl4x7lcoy977vs"
-            payload = {"bot_response": result, "phone": phone, "email": email, "location_id": location_id}
-
-            async with session.post(webhook_url, json=payload) as response:
-                pass
+        location_id = await location_task
+        payload = {"bot_response": result, "phone": phone, "email": email, "location_id": location_id}
+        webhook_dispatcher.enqueue(MAKE_WEBHOOK_URL, payload)
         return {"bot_response": result}
 
     message = [HumanMessage(content=f"""You are helpful assistant. Your aim is to extract specific places from user query. 
@@ -241,7 +353,10 @@ Assistant: shops
 User : {user_message}
 Assistant : 
 """)]
-    query = llm(message).content
+    # local extractor answers common questions, few-shot prompt is used only when it's unsure
+    query, confidence = extract_places(user_message)
+    if confidence < PLACE_EXTRACTOR_MIN_CONFIDENCE:
+        query = await acached_chat(llm_helper, message)
     print("PARAPHRASED_QUERY: ", f"{query} near {address}")
     #change to google nearby search
     # result = google_places_wrapper(f"{query} near {address}")
@@ -251,22 +366,18 @@ Assistant :
         query = "Popular places, grocery stores/shops or restaurants"
 
     try :
-        result = get_nearby_places(query,address)
+        result = await run_blocking(get_nearby_places, query,address)
     except Exception as e:
         print(f"During get_nearby_places the following error occured :{str(e)}")
         #result = f"Sorry, I was not able to find {query} near {address} within 30 miles."
         result = f"Sorry, I couldn't find anything nearby. Anything else I can help you with {address}?"
-        async with aiohttp.ClientSession() as session:
-            webhook_url = "https://hook.us1.make.com/shkla22h4n5o0teeqvwl4x7lcoy977vs"
-            #webhook_url = "https://hooks.zapier.com/hooks/catch/15488019/3s3kzre/"
-            payload = {"bot_response": result, "phone": phone, "email": email, "location_id": location_id}
-
-            async with session.post(webhook_url, json=payload) as response:
-                pass
+        location_id = await location_task
+        payload = {"bot_response": result, "phone": phone, "email": email, "location_id": location_id}
+        webhook_dispatcher.enqueue(MAKE_WEBHOOK_URL, payload)
         return {"bot_response": result}
-    result = add_distance_to_google_places(result,address)
+    result = await run_blocking(add_distance_to_google_places, result,address)
     print(result)
-    messages = chatmodel.history_add(message_history, contact_name)
+    messages = chatmodel.history_add(message_history, contact_name, **conversation_params(res))
         # Your role is to provide assistance with a human touch, similar to a supportive companion aiding a real estate agent. Aim to maintain a conversational and friendly tone.
         # Your primary task is to respond to the user's message: "{user_message}", considering the property details: "{address}" and information about nearby places: "{result}". Begin with a friendly note, mentioning the source of the data without using the phrase "Based on available information."
         # Craft responses in 2-3 sentences that are concise, directly addressing the user's inquiry, and maintaining a welcoming atmosphere.
@@ -278,119 +389,107 @@ Assistant :
             Always keep the conversation inviting by asking if there's more they'd like to know or if further assistance is needed."""
         )
     )
-    result = llm_gpt_4(messages).content
-
-    async with aiohttp.ClientSession() as session:
-        webhook_url = "https://hook.us1.make.com/shkla22h4n5o0teeqvwl4x7lcoy977vs"
-        #webhook_url = "https://hooks.zapier.com/hooks/catch/15488019/3s3kzre/"
-        payload = {"bot_response": result, "phone": phone, "email": email, "location_id": location_id}
+    result = (await run_blocking(llm_gpt_4, messages)).content
 
-        async with session.post(webhook_url, json=payload) as response:
-            pass
+    location_id = await location_task
+    payload = {"bot_response": result, "phone": phone, "email": email, "location_id": location_id}
+    webhook_dispatcher.enqueue(MAKE_WEBHOOK_URL, payload)
 
     return {"bot_response": result}
 
 
 @app.post("/find_similar_homes")
-async def find_similar_homes(request: Request):
-    chatmodel = Model()
+async def find_similar_homes(request: Request, chatmodel: Model = Depends(pooled_model)):
     res = await request.json()
     email = res.get("email")
     phone = res.get("phone")
+    # Get location ID from GHL while the endpoint does its own work
+    location_task = start_ghl_location_lookup(email, phone)
     address = res["customData"].get("address", "")
     user_message = res["customData"]["message"]
     message_history = res["customData"].get("message_history", "")
-    # Get location ID from GHL
-    location_id = await get_ghl_location_id(email, phone)
 
     print("USER_QUERY: ", f"{user_message}, {address}")
     contact_name = res["customData"]["contact_name"]
     agent_id = res["customData"].get("agent_id", "")
     print("CONTACT_NAME: ", contact_name)
-    messages = chatmodel.history_add(message_history, contact_name)
-    result = get_info_about_similar_homes(address, agent_id)
+    messages = chatmodel.history_add(message_history, contact_name, **conversation_params(res))
+    result = await aget_info_about_similar_homes(address, agent_id)
     messages.append(SystemMessage(
         content=f"""Your role is to provide assistance with a human touch, akin to a helpful companion supporting a real estate agent. Aim for a conversational and friendly tone.
-        Your main task is provide response to the user's message: "{user_message}", utilize property details: "{address}" and information about similar houses: "{result}". Start with a friendly note, by mentioning the data's source without using the phrase "Based on available information."
+        Your main task is provide response to the user's message: "{user_message}", utilize property details: "{address}" and information about similar houses: "{encode_listings(result, 'find_similar_homes')}". Start with a friendly note, by mentioning the data's source without using the phrase "Based on available information."
         Craft responses that are short, concise, with links, and directly related to the user's inquiry within their message.
         Always keep the conversation inviting by asking if there's more they'd like to know or if further assistance is needed."""
     )
     )
-    result = llm(messages).content
-
-    async with aiohttp.ClientSession() as session:
-        webhook_url = "https://hook.us1.make.com/shkla22h4n5o0teeqvwl4x7lcoy977vs"
-        #webhook_url = "https://hooks.zapier.com/hooks/catch/15488019/3s3kzre/"
-        payload = {"bot_response": result, "phone": phone, "email": email, "location_id": location_id}
+    result = (await run_blocking(llm, messages)).content
 
-        async with session.post(webhook_url, json=payload) as response:
-            pass
+    location_id = await location_task
+    payload = {"bot_response": result, "phone": phone, "email": email, "location_id": location_id}
+    webhook_dispatcher.enqueue(MAKE_WEBHOOK_URL, payload)
 
     return {"bot_response": result}
 
 
 @app.post("/find_nearby_homes")
-async def find_nearby_homes(request: Request):
-    chatmodel = Model()
+async def find_nearby_homes(request: Request, chatmodel: Model = Depends(pooled_model)):
     res = await request.json()
     email = res.get("email")
     phone = res.get("phone")
+    # Get location ID from GHL while the endpoint does its own work
+    location_task = start_ghl_location_lookup(email, phone)
     address = res["customData"].get("address", "")
     user_message = res["customData"]["message"]
     message_history = res["customData"].get("message_history", "")
     contact_name = res["customData"]["contact_name"]
 
-    # Get location ID from GHL
-    location_id = await get_ghl_location_id(email, phone)
-
     agent_id = res["customData"].get("agent_id", "")
-    messages = chatmodel.history_add(message_history, contact_name)
-    result = get_info_about_nearby_homes(address, agent_id)
+    messages = chatmodel.history_add(message_history, contact_name, **conversation_params(res))
+    result = await aget_info_about_nearby_homes(address, agent_id)
     messages.append(SystemMessage(
             content=f"""Your role is to provide assistance with a human touch, akin to a helpful companion supporting a real estate agent. Aim for a conversational and friendly tone.
-            Your main task is provide response to the user's message: "{user_message}", utilize property details: "{address}" and information about homes nearby: "{result}". Start with a friendly note, by mentioning the data's source without using the phrase "Based on available information."
+            Your main task is provide response to the user's message: "{user_message}", utilize property details: "{address}" and information about homes nearby: "{encode_listings(result, 'find_nearby_homes')}". Start with a friendly note, by mentioning the data's source without using the phrase "Based on available information."
             Craft responses that are short, concise, with links, and directly related to the user's inquiry within their message.
             Always keep the conversation inviting by asking if there's more they'd like to know or if further assistance is needed."""
         )
     )
-    result = llm(messages).content
-
-    async with aiohttp.ClientSession() as session:
-        webhook_url = "https://hook.us1.make.com/shkla22h4n5o0teeqvwl4x7lcoy977vs"
-        #webhook_url = "https://hooks.zapier.com/hooks/catch/15488019/3s3kzre/"
-        payload = {"bot_response": result, "phone": phone, "email": email, "location_id": location_id}
+    result = (await run_blocking(llm, messages)).content
 
-        async with session.post(webhook_url, json=payload) as response:
-            pass
+    location_id = await location_task
+    payload = {"bot_response": result, "phone": phone, "email": email, "location_id": location_id}
+    webhook_dispatcher.enqueue(MAKE_WEBHOOK_URL, payload)
 
     return {"bot_response": result}
 
 @app.post("/find_properties_without_address_tool")
-async def find_agent_listings(request: Request):
-    chatmodel = Model()
+async def find_agent_listings(request: Request, chatmodel: Model = Depends(pooled_model)):
     res = await request.json()
     email = res.get("email")
     phone = res.get("phone")
+    # Get location ID from GHL while the endpoint does its own work
+    location_task = start_ghl_location_lookup(email, phone)
     user_message = res["customData"]["message"]
     agent_id = res["customData"].get("agent_id", "")
     message_history = res["customData"].get("message_history", "")
     contact_name = res["customData"]["contact_name"]
     contact_id = res.get("customData").get("contact_id")
-    messages = chatmodel.history_add(message_history, contact_name)
+    messages = chatmodel.history_add(message_history, contact_name, **conversation_params(res))
     photo_link = []
-    
-    # Get location ID from GHL
-    location_id = await get_ghl_location_id(email, phone)
 
     if agent_id:
-        listings = get_agent_listings(agent_id)
-        print("LISTINGS: ", listings)
+        listings, params = await asyncio.gather(
+            aget_agent_listings(agent_id), aextract_search_params(user_message)
+        )
+        # Only best local matches go to the prompt, so its size doesn't depend on portfolio size
+        candidates = rank_listings(listings["res"], params, top_k=LISTING_CANDIDATES)
+        print(f"LISTINGS: {len(listings['res'])}, SEARCH PARAMS: {params}, CANDIDATES: {candidates}")
 
         content = f"""This is user message: {user_message}.
-        You have information about real estate agent listings: {listings["res"]}"""
+        You have information about real estate agent listings:
+{encode_listings(candidates, 'agent_listings')}"""
 
         # Limit the number of results displayed in the message (optional, for improved readability)
-        if len(listings["res"]) > 3:
+        if len(candidates) > 3:
             content += "\n**Note:** Only displaying the first 3 results for brevity."
 
         content += """
@@ -409,7 +508,7 @@ async def find_agent_listings(request: Request):
             )
         )
 
-        result = llm(messages).content
+        result = (await run_blocking(llm, messages)).content
         address_regex = r"\d+\s[\w\s]+(?:St|Rd|Blvd|Ave|Dr|Ct|Ln|Pl|Way|Loop|Sq|Pkwy|Terrace)?(?:\s\w+)*(?:\s#\d+)?\,\s[A-Za-z\s]+\,\s[A-Z]{2}\s\d{5}"
         # Remove asterisks from the result
         result = result.replace("**", "")
@@ -455,7 +554,8 @@ async def find_agent_listings(request: Request):
          #   result = "No address matched in the response. I will send more later."
     else:
         print("ELSE_OPTION")
-        result = await find_properties_without_address_tool(request)
+        with model_pool.model() as search_model:
+            result = await find_properties_without_address_tool(request, search_model)
         photo_link = result.get("photos", [])
         result = result.get("bot_response", "")
 
@@ -463,25 +563,22 @@ async def find_agent_listings(request: Request):
     photo_link_collection = {
                 f"photo link {i + 1}": photo_link[i] for i in range(len(photo_link))
             }
-    async with aiohttp.ClientSession() as session:
-        webhook_url = "https://hook.us1.make.com/shkla22h4n5o0teeqvwl4x7lcoy977vs"
-        payload = {
-            "bot_response": result,
-            "phone": phone,
-            "email": email,
-            "photo_link": photo_link_collection,
-            "contact_id": contact_id,
-            "location_id": location_id
-        }
-        async with session.post(webhook_url, json=payload) as response:
-            pass
+    location_id = await location_task
+    payload = {
+        "bot_response": result,
+        "phone": phone,
+        "email": email,
+        "photo_link": photo_link_collection,
+        "contact_id": contact_id,
+        "location_id": location_id
+    }
+    webhook_dispatcher.enqueue(MAKE_WEBHOOK_URL, payload)
 
     return {"bot_response": result, "photo_link": photo_link_collection}
 
 
 @app.post("/find_properties_without_address_tool_OLD_VERSION")
-async def find_properties_without_address_tool(request: Request):
-    chatmodel = Model()
+async def find_properties_without_address_tool(request: Request, chatmodel: Model = Depends(pooled_model)):
     res = await request.json()
     email = res.get("email")
     phone = res.get("phone")
@@ -493,11 +590,11 @@ async def find_properties_without_address_tool(request: Request):
     message_history = res["customData"].get("message_history", "")
     contact_name = res["customData"]["contact_name"]
     print("CONTACT_NAME: ", contact_name)
-    messages = chatmodel.history_add(message_history, contact_name)
+    messages = chatmodel.history_add(message_history, contact_name, **conversation_params(res))
     address_regex_full = "\d+\s[A-Za-z0-9\s]+\,\s[A-Za-z\s]+\,\s[A-Z]{2}\s\d{5}"
     mes_str = [str(element) for element in messages]
     used_addresses = re.findall(address_regex_full, ", ".join(mes_str))
-    result = search_properties_without_address(user_query)
+    result = await asearch_properties_without_address(user_query)
     print("USER_QUERY: ", user_query)
     messages.append(SystemMessage(
             content=f"""You have User message:{user_message}, {preferences}, {budget}.
@@ -510,7 +607,7 @@ async def find_properties_without_address_tool(request: Request):
             Always ask if the lead needs anything else"""
         )
     )
-    response = llm_gpt_4(messages).content
+    response = (await run_blocking(llm_gpt_4, messages)).content
     address_regex_small = "\d+\s[A-Za-z0-9\s]+\,"
     match = re.findall(address_regex_full, response)
     if not match:
@@ -545,11 +642,12 @@ async def find_properties_without_address_tool(request: Request):
 
 
 @app.post("/get_house_details_tool")
-async def get_house_details_tool(request: Request, request_body: RequestBody):
-    chatmodel = Model()
+async def get_house_details_tool(request: Request, request_body: RequestBody, chatmodel: Model = Depends(pooled_model)):
     res = await request.json()
     email = res.get("email")
     phone = res.get("phone")
+    # Get location ID from GHL while the endpoint does its own work
+    location_task = start_ghl_location_lookup(email, phone)
     user_message = res["customData"]["message"]
     address = res["customData"].get("address", "")
     message_history = res["customData"].get("message_history", "")
@@ -557,11 +655,9 @@ async def get_house_details_tool(request: Request, request_body: RequestBody):
     contact_id = res.get("customData").get("contact_id")
     print("ADDRESS: ", address)
     print("CONTACT_NAME: ", contact_name)
-    # Get location ID from GHL
-    location_id = await get_ghl_location_id(email, phone)
-    messages = chatmodel.history_add(message_history, contact_name)
+    messages = chatmodel.history_add(message_history, contact_name, **conversation_params(res))
 
-    result = get_house_property(address)
+    result = await aget_house_property(address)
 
    #  photo_link = result["imgSrc"]
     messages.append(SystemMessage(
@@ -572,24 +668,22 @@ async def get_house_details_tool(request: Request, request_body: RequestBody):
 
         )
     )
-    result = llm(messages).content
+    result = (await run_blocking(llm, messages)).content
 
-    async with aiohttp.ClientSession() as session:
-        webhook_url = "https://hook.us1.make.com/shkla22h4n5o0teeqvwl4x7lcoy977vs"
-        #webhook_url = "https://hooks.zapier.com/hooks/catch/15488019/3s3kzre/"
-        payload = {"bot_response": result, "phone": phone, "email": email, "contact_id": contact_id, "location_id": location_id}
-        async with session.post(webhook_url, json=payload) as response:
-            pass
+    location_id = await location_task
+    payload = {"bot_response": result, "phone": phone, "email": email, "contact_id": contact_id, "location_id": location_id}
+    webhook_dispatcher.enqueue(MAKE_WEBHOOK_URL, payload)
 
     return {"bot_response": result}
 
 
 @app.post("/find_distance_tool")
-async def find_distance_tool(request: Request, request_body: RequestBody):
-    chatmodel = Model()
+async def find_distance_tool(request: Request, request_body: RequestBody, chatmodel: Model = Depends(pooled_model)):
     res = await request.json()
     email = res.get("email")
     phone = res.get("phone")
+    # Get location ID from GHL while the endpoint does its own work
+    location_task = start_ghl_location_lookup(email, phone)
     address = res["customData"].get("address", "")
     address = address.strip()
     user_message = res["customData"]["message"]
@@ -600,8 +694,6 @@ async def find_distance_tool(request: Request, request_body: RequestBody):
     place_address = res["customData"].get("place_address", "")
     print("ADDRESS: ", address)
     print("PLACE_ADDRESS: ", place_address)
-    # Get location ID from GHL
-    location_id = await get_ghl_location_id(email, phone)
     city_state = address.split(",")
     print("FIRST_SPLIT_ADDRESS: ", city_state)
     if len(city_state) > 2:
@@ -610,10 +702,10 @@ async def find_distance_tool(request: Request, request_body: RequestBody):
         city_state = city_state[-1]
     print("CITY_STATE: ", city_state)
     print("USER_QUERY: ", user_query)
-    result_places = google_places_wrapper(user_query)
+    result_places = await run_blocking(google_places_wrapper, user_query)
     message = [SystemMessage(
         content=f"You are helpful assistant. If {result_places} is the same with full address: {address} - write 'Same address', otherwise write - 'Not same address'")]
-    query = llm(message).content
+    query = await acached_chat(llm_helper, message)
     print("CHECK if address is same: ", query)
     if "Google Places did not find" in result_places or query == "Same address":
         message = [HumanMessage(content=f"""
@@ -636,16 +728,18 @@ Proceed with this:
 User : {user_message}
 Assistant : 
 """)]
-        query = llm(message).content
+        query, confidence = extract_places(user_message)
+        if confidence < PLACE_EXTRACTOR_MIN_CONFIDENCE:
+            query = await acached_chat(llm_helper, message)
         print("PARAPHRASED_QUERY: ", f"{query}, {city_state}, USA")
-        result_places = google_places_wrapper(f"{query}, {city_state}, USA")
-    messages = chatmodel.history_add(message_history, contact_name)
+        result_places = await run_blocking(google_places_wrapper, f"{query}, {city_state}, USA")
+    messages = chatmodel.history_add(message_history, contact_name, **conversation_params(res))
     messages.append(SystemMessage(
             content=f"""You have information from google about places: {result_places}.
             Please extract and provide only addresses of each place line by line. Example: 1.Place: place name, Address: address of this place"""
         )
     )
-    addresses_str = llm(messages).content
+    addresses_str = (await run_blocking(llm, messages)).content
 
     addresses = addresses_str.split("\n")
     print("ADDRESSES: ", addresses)
@@ -657,7 +751,7 @@ Assistant :
 
     for element in list_addresses:
         final_addresses += f"|{element}"
-    distances_result = find_distance(final_addresses)
+    distances_result = await run_blocking(find_distance, final_addresses)
     if not distances_result:
         print("Place address: ", place_address)
         list_addresses = []
@@ -666,15 +760,15 @@ Assistant :
 
         for element in list_addresses:
             final_addresses += f"|{element}"
-        distances_result = find_distance(final_addresses)
+        distances_result = await run_blocking(find_distance, final_addresses)
         if distances_result == "Sorry, couldn't find the distance" or distances_result == "Ask about name of the location that user interested in":
             print("TRIGER")
-            result_places = google_places_wrapper(place_address)
+            result_places = await run_blocking(google_places_wrapper, place_address)
             messages = [SystemMessage(
                 content=f"""You have information from google about places: {result_places}.
                         Please extract and provide only addresses of each place line by line. Example: 1.Place: place name, Address: address of this place"""
             )]
-            addresses_str = llm(messages).content
+            addresses_str = await acached_chat(llm_helper, messages)
             print("ADRESSES_STR: ", addresses_str)
 
             addresses = addresses_str.split("\n")
@@ -686,24 +780,52 @@ Assistant :
             final_addresses = f"{address}"
             for element in list_addresses:
                 final_addresses += f"|{element}"
-            distances_result = find_distance(final_addresses)
-        messages = chatmodel.history_add(message_history, contact_name)
+            distances_result = await run_blocking(find_distance, final_addresses)
+        messages = chatmodel.history_add(message_history, contact_name, **conversation_params(res))
     print("DISTANCES_RESULT: ", distances_result)
     messages.append(SystemMessage(
     content=f"""Your role is to provide assistance with a human touch, akin to a helpful companion supporting a real estate agent. Aim for a conversational and friendly tone.
     Your main task is to respond to the user's message: "{user_message}", utilizing information from Google Places: "{result_places}" and providing car travel times instead of metric distances: "{distances_result}". Begin with a friendly note, mentioning the source of the data without using the phrase "Based on available information." Craft responses in 2-3 sentences that are concise and directly related to the user's inquiry within their message, focusing on car travel times. Always focus on car travel time. Avoid providing the full address, keeping the conversation friendly and inviting by asking if there's more they'd like to know or if further assistance regarding only the car drive distance or amenities is needed."""
 ))
-    result = llm_gpt_4(messages).content
-    async with aiohttp.ClientSession() as session:
-        webhook_url = "https://hook.us1.make.com/shkla22h4n5o0teeqvwl4x7lcoy977vs"
-        #webhook_url = "https://hooks.zapier.com/hooks/catch/15488019/3s3kzre/"
-        payload = {"bot_response": result, "phone": phone, "email": email, "contact_id": contact_id, "location_id": location_id}
-        async with session.post(webhook_url, json=payload) as response:
-            pass
+    result = (await run_blocking(llm_gpt_4, messages)).content
+    location_id = await location_task
+    payload = {"bot_response": result, "phone": phone, "email": email, "contact_id": contact_id, "location_id": location_id}
+    webhook_dispatcher.enqueue(MAKE_WEBHOOK_URL, payload)
 
     return {"bot_response": result}
 
 
+@app.get("/cache_stats")
+async def cache_stats():
+    return {
+        "zpid": zpid_cache.stats(),
+        "property": property_cache.stats(),
+        "ghl_location": location_id_cache.stats(),
+        "agent_listings": agent_listings_index.stats(),
+        "place_details": place_details_cache.stats(),
+        "geocode": geocode_cache.stats(),
+        "nearby_tiles": nearby_tiles.stats(),
+        "llm_responses": llm_cache_stats(),
+        "rate_limits": limiter_stats(),
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "blocking_pool": executor_stats(),
+        "model_pool": model_pool.stats(),
+        "webhooks": webhook_dispatcher.stats(),
+        "distance_matrix": distance_stats(),
+        "nearby_places": places_stats(),
+        "agent_tasks": agent_tasks.stats(),
+        "conversations": conversation_store.stats(),
+        "property_search": search_stats,
+        "projections": projections_stats(),
+        "listing_tables": listing_tables_stats(),
+    }
+
+
 LOG_FILE = "logfile.txt"
 
 
@@ -729,8 +851,7 @@ async def test_webhook(request: Request):
 
 
 @app.post("/realtor_get_tax_or_price_info")
-async def realtor_get_tax_or_price_info(request: Request):
-    chatmodel = Model()
+async def realtor_get_tax_or_price_info(request: Request, chatmodel: Model = Depends(pooled_model)):
     res = await request.json()
     email = res.get("email")
     phone = res.get("phone")
@@ -739,8 +860,8 @@ async def realtor_get_tax_or_price_info(request: Request):
     user_message = res["customData"]["message"]
     contact_name = res["customData"]["contact_name"]
     contact_id = res.get("customData").get("contact_id")
-    messages = chatmodel.history_add(message_history, contact_name)
-    result = get_tax_and_price_information_from_realtor(address)
+    messages = chatmodel.history_add(message_history, contact_name, **conversation_params(res))
+    result = await run_blocking(get_tax_and_price_information_from_realtor, address)
     messages.append(SystemMessage(
             content=f"""You have User message:{user_message}.
             This property located at: {address}.
@@ -749,20 +870,15 @@ async def realtor_get_tax_or_price_info(request: Request):
             Always ask if lead need anything else"""
         )
     )
-    result = llm(messages).content
-    async with aiohttp.ClientSession() as session:
-        webhook_url = "https://hook.us1.make.com/shkla22h4n5o0teeqvwl4x7lcoy977vs"
-        #webhook_url = "https://hooks.zapier.com/hooks/catch/15488019/3s3kzre/"
-        payload = {"bot_response": result, "phone": phone, "email": email, "contact_id": contact_id}
-        async with session.post(webhook_url, json=payload) as response:
-            pass
+    result = (await run_blocking(llm, messages)).content
+    payload = {"bot_response": result, "phone": phone, "email": email, "contact_id": contact_id}
+    webhook_dispatcher.enqueue(MAKE_WEBHOOK_URL, payload)
 
     return {"bot_response": result}
 
 
 @app.post("/realtor_get_property_without_address")
-async def realtor_get_property_without_address(request: Request):
-    chatmodel = Model()
+async def realtor_get_property_without_address(request: Request, chatmodel: Model = Depends(pooled_model)):
     res = await request.json()
     email = res.get("email")
     phone = res.get("phone")
@@ -772,43 +888,39 @@ async def realtor_get_property_without_address(request: Request):
     user_query = f"{user_message} + {address}"
     contact_name = res["customData"]["contact_name"]
     contact_id = res.get("customData").get("contact_id")
-    messages = chatmodel.history_add(message_history, contact_name)
-    result = realtor_search_properties_without_address(user_query)
+    messages = chatmodel.history_add(message_history, contact_name, **conversation_params(res))
+    result = await run_blocking(realtor_search_properties_without_address, user_query)
     messages.append(SystemMessage(
             content=f"""You have User message:{user_message}.
-            This is information about homes:{result}.
+            This is information about homes:
+{encode_listings(result, 'realtor_search')}
             Use this information to provide a concise answer on the User message
             Always ask if lead need anything else"""
         )
     )
-    result = llm(messages).content
+    result = (await run_blocking(llm, messages)).content
 
-    async with aiohttp.ClientSession() as session:
-        webhook_url = "https://hook.us1.make.com/shkla22h4n5o0teeqvwl4x7lcoy977vs"
-        #webhook_url = "https://hooks.zapier.com/hooks/catch/15488019/3s3kzre/"
-        payload = {"bot_response": result, "phone": phone, "email": email, "contact_id": contact_id}
-        async with session.post(webhook_url, json=payload) as response:
-            pass
+    payload = {"bot_response": result, "phone": phone, "email": email, "contact_id": contact_id}
+    webhook_dispatcher.enqueue(MAKE_WEBHOOK_URL, payload)
 
     return {"bot_response": result}
 
 
 @app.post("/realtor_get_property_details")
-async def realtor_get_property_details(request: Request):
-    chatmodel = Model()
+async def realtor_get_property_details(request: Request, chatmodel: Model = Depends(pooled_model)):
     res = await request.json()
     email = res.get("email")
     phone = res.get("phone")
+    # Get location ID from GHL while the endpoint does its own work
+    location_task = start_ghl_location_lookup(email, phone)
     address = res["customData"].get("address", "")
     message_history = res["customData"].get("message_history", "")
     user_message = res["customData"]["message"]
     user_query = f"{user_message} + {address}"
     contact_name = res["customData"]["contact_name"]
     contact_id = res.get("customData").get("contact_id")
-    messages = chatmodel.history_add(message_history, contact_name)
-    result = realtor_get_house_details(user_query)
-    # Get location ID from GHL
-    location_id = await get_ghl_location_id(email, phone)
+    messages = chatmodel.history_add(message_history, contact_name, **conversation_params(res))
+    result = await run_blocking(realtor_get_house_details, user_query)
     messages.append(SystemMessage(
             content=f"""This is User message:{user_message}.
             Property located at {address}.
@@ -817,13 +929,10 @@ async def realtor_get_property_details(request: Request):
             Always ask if lead need anything else"""
         )
     )
-    result = llm(messages).content
-
-    async with aiohttp.ClientSession() as session:
-        webhook_url = "https://hook.us1.make.com/shkla22h4n5o0teeqvwl4x7lcoy977vs"
-        #webhook_url = "https://hooks.zapier.com/hooks/catch/15488019/3s3kzre/"
-        payload = {"bot_response": result, "phone": phone, "email": email, "contact_id": contact_id, "location_id": location_id}
-        async with session.post(webhook_url, json=payload) as response:
-            pass
+    result = (await run_blocking(llm, messages)).content
+
+    location_id = await location_task
+    payload = {"bot_response": result, "phone": phone, "email": email, "contact_id": contact_id, "location_id": location_id}
+    webhook_dispatcher.enqueue(MAKE_WEBHOOK_URL, payload)
 
     return {"bot_response": result}
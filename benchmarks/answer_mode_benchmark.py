@@ -0,0 +1,72 @@
+"""Latency and token usage of two-pass (agent + enhance_ai_response) vs single-pass answers.
+
+Makes real OpenAI and tool (Zillow, Google) calls, so all API keys from README must be set.
+Every question is answered in both modes with a fresh Model through Model.response, the
+same path as /send_message_to_ai, with a short message history so the previous turn goes
+into the prompt. get_openai_callback sees the LLM calls of the blocking pool too, since
+run_blocking passes context vars to its threads.
+
+    python benchmarks/answer_mode_benchmark.py --address "123 Main St, Austin, TX 78701"
+    python benchmarks/answer_mode_benchmark.py --address "..." --question "How many bedrooms?" --repeat 3
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.callbacks import get_openai_callback  # noqa: E402
+
+from ai_model import Model  # noqa: E402
+
+CONTACT_NAME = "Alex"
+HISTORY = f"{CONTACT_NAME}: Hi, I am looking at this house.\nAgent: Great, what would you like to know about it?"
+QUESTIONS = [
+    "How many bedrooms and bathrooms does it have?",
+    "What is the property tax?",
+    "Are there any schools nearby?",
+]
+
+
+def answer(question: str, single_pass: bool):
+    chatmodel = Model()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull), get_openai_callback() as callback:
+        start = time.perf_counter()
+        text = asyncio.run(chatmodel.response(question, HISTORY, CONTACT_NAME, single_pass=single_pass))
+        elapsed = time.perf_counter() - start
+    return text, elapsed, callback
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--address", required=True)
+    parser.add_argument("--question", action="append", help="question to ask, can be repeated")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    results = {"two_pass": [], "single_pass": []}
+    for question in args.question or QUESTIONS:
+        user_query = f"{question} I am interested in {args.address}"
+        for _ in range(args.repeat):
+            for mode in results:
+                text, elapsed, callback = answer(user_query, mode == "single_pass")
+                results[mode].append((elapsed, callback.prompt_tokens, callback.completion_tokens, callback.total_cost))
+                print(f"[{mode}] {question!r} {elapsed:.2f} s, {callback.total_tokens} tokens\n  {text}\n")
+
+    print(f"{'mode':<12} {'median s':>9} {'mean s':>8} {'prompt tok':>11} {'compl tok':>10} {'cost $':>9}")
+    for mode, rows in results.items():
+        seconds = [row[0] for row in rows]
+        print(
+            f"{mode:<12} {statistics.median(seconds):9.2f} {statistics.mean(seconds):8.2f} "
+            f"{statistics.mean(row[1] for row in rows):11.0f} {statistics.mean(row[2] for row in rows):10.0f} "
+            f"{statistics.mean(row[3] for row in rows):9.5f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Per-request overhead of getting a Model: full agent rebuild (old behaviour) vs shared agent vs pool.
+
+Run from the repository root (no network calls are made, any OPENAI_API_KEY value works):
+    OPENAI_API_KEY=sk-... python benchmarks/model_pool_benchmark.py
+"""
+
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_model import Model, ModelPool, build_agent, get_shared_agent  # noqa: E402
+
+
+def measure(name: str, func, iterations: int):
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        func()  # warm up
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        elapsed = time.perf_counter() - start
+    print(f"{name:<40} {elapsed / iterations * 1000:10.3f} ms/request")
+
+
+def main():
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        get_shared_agent()
+    pool = ModelPool()
+
+    def from_pool():
+        with pool.model() as chatmodel:
+            chatmodel.memory.chat_memory.add_user_message("Hello")
+
+    measure("Model(shared_agent=build_agent()) (before)", lambda: Model(shared_agent=build_agent()), 20)
+    measure("Model() with shared agent", Model, 500)
+    measure("model_pool.model()", from_pool, 5000)
+
+
+if __name__ == "__main__":
+    main()
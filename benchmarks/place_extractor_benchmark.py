@@ -0,0 +1,111 @@
+"""Local place extractor vs the few-shot "extract specific places" LLM prompt.
+
+Reports how many messages are answered locally, how often the local answer agrees
+with the LLM answer and the LLM latency saved.
+
+Messages are read from a JSON lines file with "message" and optionally "llm_query"
+(recorded LLM answer) and "llm_seconds" (recorded LLM latency). The bundled
+benchmarks/data/place_queries.jsonl holds sample messages with hand-written reference
+answers. With --live the prompt used by /google_places is sent to OpenAI for every
+message and its answers and latencies are used instead.
+
+    python benchmarks/place_extractor_benchmark.py
+    OPENAI_API_KEY=sk-... python benchmarks/place_extractor_benchmark.py --live
+    python benchmarks/place_extractor_benchmark.py --file recorded_messages.jsonl
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from place_extractor import MIN_CONFIDENCE, extract_places  # noqa: E402
+
+DEFAULT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "place_queries.jsonl")
+
+# copy of the /google_places prompt in api.py
+PROMPT = """You are helpful assistant. Your aim is to extract specific places from user query.
+If there are any specific places in user query, write 'There are no specific places in user query'
+
+Example 1:
+User: 'I want to know if there is the Angel Stadium nearby?'
+Assistant: Angel Stadium
+
+Example 2 :
+User: 'Is the house close to any high schools?'
+Assistant: high schools
+
+Example 3:
+User: Hello
+Assistant: There are no specific places in user query
+
+Example 4:
+User: Are there any shops?
+Assistant: shops
+
+
+User : {message}
+Assistant :
+"""
+
+
+def normalize(query: str) -> str:
+    return re.sub(r"[^\w\s,]", "", (query or "").lower()).strip()
+
+
+def ask_llm(message: str):
+    from langchain.chat_models import ChatOpenAI
+    from langchain.schema import HumanMessage
+
+    llm = ChatOpenAI(temperature=0.0, max_tokens=500, model="gpt-4o-mini")
+    start = time.perf_counter()
+    answer = llm([HumanMessage(content=PROMPT.format(message=message))]).content
+    return answer, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--file", default=DEFAULT_FILE)
+    parser.add_argument("--live", action="store_true", help="get reference answers and latency from OpenAI")
+    parser.add_argument("--llm-seconds", type=float, default=0.8,
+                        help="LLM latency assumed for records without llm_seconds")
+    args = parser.parse_args()
+
+    with open(args.file) as file:
+        records = [json.loads(line) for line in file if line.strip()]
+
+    local_answers = agreed = 0
+    local_seconds = saved_seconds = 0.0
+    disagreements = []
+    for record in records:
+        if args.live:
+            record["llm_query"], record["llm_seconds"] = ask_llm(record["message"])
+        start = time.perf_counter()
+        query, confidence = extract_places(record["message"])
+        elapsed = time.perf_counter() - start
+        local_seconds += elapsed
+        if confidence < MIN_CONFIDENCE:
+            continue
+        local_answers += 1
+        saved_seconds += record.get("llm_seconds", args.llm_seconds) - elapsed
+        if normalize(query) == normalize(record.get("llm_query")):
+            agreed += 1
+        else:
+            disagreements.append((record["message"], query, record.get("llm_query")))
+
+    total = len(records)
+    print(f"messages:                    {total}")
+    print(f"answered locally:            {local_answers} ({local_answers / total:.0%})")
+    print(f"agreement with LLM (local):  {agreed}/{local_answers} ({agreed / max(local_answers, 1):.0%})")
+    print(f"avg local extraction time:   {local_seconds / total * 1000:.3f} ms")
+    print(f"LLM time saved:              {saved_seconds:.2f} s total, {saved_seconds / total:.3f} s per message")
+    for message, local, reference in disagreements:
+        print(f"  disagree: {message!r}: local={local!r} llm={reference!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Bounded thread pool for blocking calls (LangChain LLM calls, googlemaps, requests)
+made from async FastAPI handlers, so they don't freeze the event loop.
+
+    result = await run_blocking(llm, messages)
+
+Pool size and queue bound are configured with BLOCKING_POOL_SIZE and BLOCKING_QUEUE_SIZE.
+When the queue is full, callers wait on the event loop until a slot frees up.
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", 16))
+QUEUE_SIZE = int(os.getenv("BLOCKING_QUEUE_SIZE", 64))
+
+_executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="blocking")
+_slots = None
+_stats_lock = threading.Lock()
+_stats = {
+    "waiting_for_slot": 0,  # callers blocked because queue is full
+    "queued": 0,  # submitted to the pool, waiting for a free thread
+    "running": 0,
+    "completed": 0,
+    "failed": 0,
+    "max_queued": 0,
+    "total_queue_seconds": 0.0,
+}
+
+
+def _change(**deltas):
+    with _stats_lock:
+        for key, delta in deltas.items():
+            _stats[key] += delta
+        _stats["max_queued"] = max(_stats["max_queued"], _stats["queued"])
+
+
+def _get_slots() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(POOL_SIZE + QUEUE_SIZE)
+    return _slots
+
+
+def _tracked(func: Callable, submitted_at: float) -> Callable:
+    def wrapper():
+        _change(queued=-1, running=1, total_queue_seconds=time.monotonic() - submitted_at)
+        try:
+            result = func()
+        except BaseException:
+            _change(running=-1, failed=1)
+            raise
+        _change(running=-1, completed=1)
+        return result
+    return wrapper
+
+
+def _on_done(future):
+    # future cancelled before a thread picked it up, wrapper never ran
+    if future.cancelled():
+        _change(queued=-1)
+
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """Run blocking ``func(*args, **kwargs)`` in the bounded pool and await its result."""
+    # like asyncio.to_thread, the call sees the caller's context vars (LangChain callbacks, tracing)
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    slots = _get_slots()
+    _change(waiting_for_slot=1)
+    try:
+        await slots.acquire()
+    finally:
+        _change(waiting_for_slot=-1)
+    try:
+        _change(queued=1)
+        future = _executor.submit(_tracked(call, time.monotonic()))
+        future.add_done_callback(_on_done)
+        return await asyncio.wrap_future(future)
+    finally:
+        slots.release()
+
+
+def executor_stats() -> dict:
+    """Queue-depth gauge of the blocking pool"""
+    with _stats_lock:
+        stats = dict(_stats)
+    finished = stats["completed"] + stats["failed"]
+    stats["total_queue_seconds"] = round(stats["total_queue_seconds"], 3)
+    stats["avg_queue_seconds"] = round(stats["total_queue_seconds"] / finished, 4) if finished else 0.0
+    stats["pool_size"] = POOL_SIZE
+    stats["queue_size"] = QUEUE_SIZE
+    return stats
@@ -0,0 +1,310 @@
+"""In-process LRU/TTL cache with optional SQLite persistence.
+
+Used to avoid repeating RapidAPI / Google calls for data that does not change
+between messages of the same conversation (zpids, property documents, ...).
+"""
+
+import asyncio
+import copy
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Optional
+
+
+class TTLCache:
+    """Thread-safe LRU cache where every entry expires after a TTL.
+
+    Args:
+        name (str): Name used in stats and as SQLite table name
+        maxsize (int): Maximum number of entries kept in memory (LRU eviction)
+        ttl (float): Lifetime of regular entries in seconds
+        negative_ttl (Optional[float]): Lifetime of negative entries ("not found" results).
+            Defaults to ``ttl``
+        path (Optional[str]): Path to SQLite file. When set, entries survive restarts.
+            Values must be JSON serializable in that case
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 3600,
+                 negative_ttl: Optional[float] = None, path: Optional[str] = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self._data = OrderedDict()  # key -> (value, expires_at, negative)
+        self._lock = threading.RLock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                f'CREATE TABLE IF NOT EXISTS "{name}" '
+                "(key TEXT PRIMARY KEY, value TEXT, expires_at REAL, negative INTEGER)"
+            )
+            self._db.commit()
+
+    def _load_from_disk(self, key: str):
+        row = self._db.execute(
+            f'SELECT value, expires_at, negative FROM "{self.name}" WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at, negative = row
+        if expires_at < time.time():
+            self._db.execute(f'DELETE FROM "{self.name}" WHERE key = ?', (key,))
+            self._db.commit()
+            return None
+        return json.loads(value), expires_at, bool(negative)
+
+    def _store(self, key: str, entry):
+        self._data[key] = entry
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return cached value for key or default if it is missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] < time.time():
+                del self._data[key]
+                entry = None
+            if entry is None and self._db is not None:
+                entry = self._load_from_disk(key)
+                if entry is not None:
+                    self._store(key, entry)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            if entry[2]:
+                self.negative_hits += 1
+            return entry[0]
+
+    def peek(self, key: str, default: Any = None) -> Any:
+        """Return unexpired value from memory without touching counters or LRU order"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] < time.time():
+                return default
+            return entry[0]
+
+    def set(self, key: str, value: Any, negative: bool = False, ttl: Optional[float] = None):
+        """Store value. Negative entries ("not found" answers) use ``negative_ttl``."""
+        if ttl is None:
+            ttl = self.negative_ttl if negative else self.ttl
+        entry = (value, time.time() + ttl, negative)
+        with self._lock:
+            self._store(key, entry)
+            if self._db is not None:
+                self._db.execute(
+                    f'INSERT OR REPLACE INTO "{self.name}" VALUES (?, ?, ?, ?)',
+                    (key, json.dumps(value), entry[1], int(negative)),
+                )
+                self._db.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+            if self._db is not None:
+                self._db.execute(f'DELETE FROM "{self.name}" WHERE key = ?', (key,))
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            if self._db is not None:
+                self._db.execute(f'DELETE FROM "{self.name}"')
+                self._db.commit()
+
+    def stats(self) -> dict:
+        """Hit/miss counters, useful for checking that the cache actually helps."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "persistent": self._db is not None,
+            }
+
+
+class StaleWhileRevalidateCache:
+    """LRU cache that serves stale entries immediately and refreshes them in background.
+
+    Entries younger than ``fresh_ttl`` are returned as is. Entries between ``fresh_ttl``
+    and ``max_age`` are returned as well, but a background refresh is scheduled.
+    Older entries are reloaded synchronously.
+
+    Args:
+        name (str): Name used in stats
+        fresh_ttl (float): Age in seconds while entry is considered fresh
+        max_age (float): Age in seconds after which stale entry is not served anymore
+        max_bytes (int): Memory cap, estimated as size of JSON encoded values
+        maxsize (int): Maximum number of entries
+        copy_values (bool): Return deep copies, so callers can mutate them. Disable for values
+            that are never mutated
+    """
+
+    def __init__(self, name: str, fresh_ttl: float = 900, max_age: float = 24 * 3600,
+                 max_bytes: int = 64 * 1024 * 1024, maxsize: int = 2048, copy_values: bool = True):
+        self.name = name
+        self.copy_values = copy_values
+        self.fresh_ttl = fresh_ttl
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.maxsize = maxsize
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.total_bytes = 0
+        self._data = OrderedDict()  # key -> (value, created_at, size)
+        self._refreshing = set()
+        self._tasks = set()  # keeps references to background refresh tasks
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix=f"{name}-refresh")
+
+    def _copy(self, value: Any) -> Any:
+        return copy.deepcopy(value) if self.copy_values else value
+
+    @staticmethod
+    def _size_of(value: Any) -> int:
+        try:
+            return len(json.dumps(value, default=lambda obj: getattr(obj, "__dict__", str(obj))))
+        except (TypeError, ValueError):
+            return len(str(value))
+
+    def _store(self, key: str, value: Any):
+        size = self._size_of(value)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[2]
+            if size > self.max_bytes:
+                return
+            self._data[key] = (value, time.time(), size)
+            self.total_bytes += size
+            while len(self._data) > self.maxsize or self.total_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def _refresh(self, key: str, loader: Callable[[], Any], should_cache: Callable[[Any], bool]):
+        try:
+            value = loader()
+            if should_cache(value):
+                self._store(key, value)
+        except Exception as e:
+            logging.error(f"Background refresh of {self.name}[{key}] failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _lookup(self, key: str):
+        """
+        Return (found, value, needs_refresh). Refresh is reported only once per key,
+        until the refresh finishes.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                age = now - entry[1]
+                if age < self.fresh_ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return True, self._copy(entry[0]), False
+                if age < self.max_age:
+                    self._data.move_to_end(key)
+                    self.stale_hits += 1
+                    needs_refresh = key not in self._refreshing
+                    if needs_refresh:
+                        self._refreshing.add(key)
+                        self.refreshes += 1
+                    return True, self._copy(entry[0]), needs_refresh
+            self.misses += 1
+            return False, None, False
+
+    def get_or_load(self, key: str, loader: Callable[[], Any],
+                    should_cache: Callable[[Any], bool] = lambda value: True) -> Any:
+        """
+        Return deep copy of cached value, loading it with ``loader`` when needed.
+        Values for which ``should_cache`` returns False (errors) are returned, but not stored.
+        """
+        found, value, needs_refresh = self._lookup(key)
+        if needs_refresh:
+            self._executor.submit(self._refresh, key, loader, should_cache)
+        if found:
+            return value
+
+        value = loader()
+        if should_cache(value):
+            self._store(key, value)
+            return self._copy(value)
+        return value
+
+    async def _arefresh(self, key: str, loader: Callable[[], Awaitable[Any]],
+                        should_cache: Callable[[Any], bool]):
+        try:
+            value = await loader()
+            if should_cache(value):
+                self._store(key, value)
+        except Exception as e:
+            logging.error(f"Background refresh of {self.name}[{key}] failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    async def aget_or_load(self, key: str, loader: Callable[[], Awaitable[Any]],
+                           should_cache: Callable[[Any], bool] = lambda value: True) -> Any:
+        """Same as ``get_or_load``, but ``loader`` is a coroutine function and refresh runs as a task."""
+        found, value, needs_refresh = self._lookup(key)
+        if needs_refresh:
+            task = asyncio.create_task(self._arefresh(key, loader, should_cache))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if found:
+            return value
+
+        value = await loader()
+        if should_cache(value):
+            self._store(key, value)
+            return self._copy(value)
+        return value
+
+    def peek(self, key: str) -> Any:
+        """Return cached value regardless of its age, without touching counters or LRU order"""
+        with self._lock:
+            entry = self._data.get(key)
+            return None if entry is None else self._copy(entry[0])
+
+    def delete(self, key: str):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry[2]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "background_refreshes": self.refreshes,
+            }
@@ -0,0 +1,174 @@
+"""Per-contact store of parsed conversation turns.
+
+GHL sends the whole message history ("<contact_name>: ... Agent: ...") with every
+request. The store remembers turns already parsed for the contact and only parses
+the part of the history that was appended since the previous request. Clients can
+also send just the new part (message_history_delta), optionally with its offset in the
+full history (message_history_offset). A delta that was already applied is skipped, so
+repeated calls within one request and webhook retries don't duplicate turns.
+"""
+
+import os
+from typing import List, Optional, Tuple
+
+from cache import TTLCache
+
+# Characters before the parsed point that must match to treat a history as continuation
+FINGERPRINT_LENGTH = 64
+
+
+def parse_segment(segment: str) -> Optional[Tuple[str, str]]:
+    """(user message, ai message) of one '<contact_name>:' segment, None if it has no single Agent reply"""
+    if segment.strip() != '' and len(segment.split("Agent:")) == 2:
+        user_message, ai_message = segment.split("Agent:")
+        return user_message.strip(), ai_message.strip()
+    return None
+
+
+def parse_turns(text: str, contact_name: str) -> List[Tuple[str, str]]:
+    """Stateless parse of the whole history, same rules as Model.split_messages"""
+    turns = []
+    for segment in text.split(f"{contact_name}:"):
+        turn = parse_segment(segment)
+        if turn:
+            turns.append(turn)
+    return turns
+
+
+class Conversation:
+    """Parsed turns of one contact.
+
+    Everything before ``consumed`` is folded into ``turns``. The last segment can still
+    grow (i.e Agent reply is appended later), so it is kept as ``tail`` text and parsed
+    again on every update.
+    """
+
+    __slots__ = ("contact_name", "turns", "consumed", "fingerprint", "tail", "last_delta")
+
+    def __init__(self, contact_name: str):
+        self.contact_name = contact_name
+        self.turns = []
+        self.consumed = 0
+        self.fingerprint = ""
+        self.tail = ""
+        self.last_delta = None
+
+    @property
+    def length(self) -> int:
+        """Length of the full history parsed so far"""
+        return self.consumed + len(self.tail)
+
+    def unapplied(self, delta: str, offset: Optional[int] = None) -> Optional[str]:
+        """
+        Part of delta that is not parsed yet, "" if all of it was applied already.
+
+        offset (Optional[int]) - position of delta in the full history. Without it only a repeat
+            of the last applied delta is recognized
+        return (Optional[str]) - None if offset is after the parsed text (some delta was missed)
+        """
+        if offset is None:
+            return "" if delta == self.last_delta else delta
+        if offset > self.length:
+            return None
+        return delta[self.length - offset:]
+
+    def is_continuation(self, history: str) -> bool:
+        return (
+            len(history) >= self.consumed
+            and history[max(0, self.consumed - FINGERPRINT_LENGTH):self.consumed] == self.fingerprint
+        )
+
+    def extend(self, text: str, offset: int):
+        """Parse text that follows the consumed part. offset is position of text in the full history"""
+        marker = f"{self.contact_name}:"
+        last = text.rfind(marker)
+        if last > 0:
+            # segments before the last marker are complete
+            for segment in text[:last].split(marker):
+                turn = parse_segment(segment)
+                if turn:
+                    self.turns.append(turn)
+            self.fingerprint = (self.fingerprint + text[:last])[-FINGERPRINT_LENGTH:]
+            self.consumed = offset + last
+            text = text[last:]
+        self.tail = text
+
+    def all_turns(self) -> List[Tuple[str, str]]:
+        turn = parse_segment(self.tail.split(f"{self.contact_name}:", 1)[-1]) if self.tail else None
+        return self.turns + [turn] if turn else list(self.turns)
+
+
+class ConversationStore:
+    """contact_id -> Conversation with LRU/TTL eviction.
+
+    Args:
+        maxsize (int): Max number of conversations kept
+        ttl (float): Seconds after which an idle conversation is parsed from scratch again
+    """
+
+    def __init__(self, maxsize: int = 5000, ttl: float = 3600):
+        self._cache = TTLCache("conversations", maxsize=maxsize, ttl=ttl)
+        self.metrics = {"full_parses": 0, "incremental_parses": 0, "delta_updates": 0,
+                        "duplicate_deltas": 0, "parsed_chars": 0}
+
+    def turns(self, contact_id: Optional[str], contact_name: str, message_history: str = "",
+              history_delta: Optional[str] = None, history_offset: Optional[int] = None) -> List[Tuple[str, str]]:
+        """
+        Update conversation of the contact and return all its (user message, ai message) turns.
+
+        message_history (str) - full history, only the part after already parsed text is parsed
+        history_delta (Optional[str]) - text appended to the history since the previous request,
+            used instead of message_history when the contact is known
+        history_offset (Optional[int]) - position of history_delta in the full history
+        """
+        message_history = message_history or ""
+        if not contact_id:
+            self.metrics["full_parses"] += 1
+            self.metrics["parsed_chars"] += len(message_history)
+            return parse_turns(message_history, contact_name)
+
+        conversation = self._cache.get(contact_id)
+        if conversation is not None and conversation.contact_name != contact_name:
+            conversation = None
+
+        delta = None
+        if conversation is not None and history_delta is not None:
+            delta = conversation.unapplied(history_delta, history_offset)
+            if delta is None:
+                print(f"HISTORY_DELTA_GAP for contact {contact_id}: offset {history_offset}, parsed {conversation.length}")
+
+        if delta == "":
+            self.metrics["duplicate_deltas"] += 1
+        elif delta is not None:
+            self.metrics["delta_updates"] += 1
+            self.metrics["parsed_chars"] += len(conversation.tail) + len(delta)
+            conversation.extend(conversation.tail + delta, conversation.consumed)
+        elif history_delta is None and conversation is not None and conversation.is_continuation(message_history):
+            self.metrics["incremental_parses"] += 1
+            self.metrics["parsed_chars"] += len(message_history) - conversation.consumed
+            conversation.extend(message_history[conversation.consumed:], conversation.consumed)
+        else:
+            # unknown contact or history that doesn't continue the stored one
+            conversation = Conversation(contact_name)
+            text = message_history if history_delta is None else message_history + history_delta
+            self.metrics["full_parses"] += 1
+            self.metrics["parsed_chars"] += len(text)
+            conversation.extend(text, 0)
+        if history_delta is not None:
+            conversation.last_delta = history_delta
+        self._cache.set(contact_id, conversation)
+        return conversation.all_turns()
+
+    def forget(self, contact_id: str):
+        self._cache.delete(contact_id)
+
+    def stats(self) -> dict:
+        stats = self._cache.stats()
+        stats.update(self.metrics)
+        return stats
+
+
+conversation_store = ConversationStore(
+    maxsize=int(os.getenv("CONVERSATION_STORE_SIZE", 5000)),
+    ttl=float(os.getenv("CONVERSATION_STORE_TTL", 3600)),
+)
@@ -2,11 +2,31 @@
 """
 
 import logging
-from typing import Any, Dict, Optional
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
 
 from langchain_core.pydantic_v1 import BaseModel, Extra, root_validator
 from langchain_core.utils import get_from_dict_or_env
 
+from cache import TTLCache
+
+# Only the fields rendered by format_place_details are requested from Place Details
+DETAIL_FIELDS = ["name", "formatted_address", "formatted_phone_number", "website", "place_id"]
+
+# place_id -> masked place details result
+place_details_cache = TTLCache(
+    "place_details",
+    maxsize=int(os.getenv("PLACE_DETAILS_CACHE_SIZE", 5000)),
+    ttl=float(os.getenv("PLACE_DETAILS_CACHE_TTL", 24 * 3600)),
+)
+_details_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PLACE_DETAILS_CONCURRENCY", 8)), thread_name_prefix="place-details"
+)
+_clients = {}  # api key -> googlemaps.Client, shared by all wrapper instances
+_clients_lock = threading.Lock()
+
 
 class CustomGooglePlacesAPIWrapper(BaseModel):
     """Wrapper around Google Places API.
@@ -31,6 +51,7 @@ class CustomGooglePlacesAPIWrapper(BaseModel):
     gplaces_api_key: Optional[str] = None
     google_map_client: Any  #: :meta private:
     top_k_results: Optional[int] = None
+    api_calls: int = 0  #: Places requests (text search + uncached details) made by the last run
 
     class Config:
         """Configuration for this pydantic object."""
@@ -48,7 +69,10 @@ class CustomGooglePlacesAPIWrapper(BaseModel):
         try:
             import googlemaps
 
-            values["google_map_client"] = googlemaps.Client(gplaces_api_key)
+            with _clients_lock:
+                if gplaces_api_key not in _clients:
+                    _clients[gplaces_api_key] = googlemaps.Client(gplaces_api_key)
+                values["google_map_client"] = _clients[gplaces_api_key]
         except ImportError:
             raise ImportError(
                 "Could not import googlemaps python package. "
@@ -59,6 +83,7 @@ class CustomGooglePlacesAPIWrapper(BaseModel):
     def run(self, query: str) -> str:
         """Run Places search and get k number of places that exists that match."""
         search_results = self.google_map_client.places(query,region='ca')["results"]
+        self.api_calls = 1
         num_to_return = len(search_results)
 
         places = []
@@ -72,24 +97,33 @@ class CustomGooglePlacesAPIWrapper(BaseModel):
             else min(num_to_return, self.top_k_results)
         )
 
-        for i in range(num_to_return):
-            result = search_results[i]
-            details = self.fetch_place_details(result["place_id"])
-
+        # details of all results are fetched concurrently, order of search results is kept
+        place_ids = [result["place_id"] for result in search_results[:num_to_return]]
+        for details, fetched in _details_executor.map(self._fetch_place_details, place_ids):
+            self.api_calls += fetched
             if details is not None:
                 places.append(details)
 
         return "\n".join([f"{i+1}. {item}" for i, item in enumerate(places)])
 
     def fetch_place_details(self, place_id: str) -> Optional[str]:
+        return self._fetch_place_details(place_id)[0]
+
+    def _fetch_place_details(self, place_id: str) -> Tuple[Optional[str], bool]:
+        """Formatted details and whether Place Details request was made (cache miss)"""
+        fetched = False
         try:
-            place_details = self.google_map_client.place(place_id)
-            place_details["place_id"] = place_id
+            result = place_details_cache.get(place_id)
+            if result is None:
+                fetched = True
+                result = self.google_map_client.place(place_id, fields=DETAIL_FIELDS).get("result", {})
+                place_details_cache.set(place_id, result)
+            place_details = {"result": result, "place_id": place_id}
             formatted_details = self.format_place_details(place_details)
-            return formatted_details
+            return formatted_details, fetched
         except Exception as e:
             logging.error(f"An Error occurred while fetching place details: {e}")
-            return None
+            return None, fetched
 
     def format_place_details(self, place_details: Dict[str, Any]) -> Optional[str]:
         try:
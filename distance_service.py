@@ -0,0 +1,86 @@
+"""Batched Google Distance Matrix lookups.
+
+One origin and N destinations are sent as a single distance_matrix request
+(chunked at the API limit of 25 destinations) over a shared googlemaps client.
+"""
+
+from typing import List
+
+from geocoder import get_gmaps_client, geocode, cached_geocode
+
+# Distance Matrix API allows up to 25 origins or 25 destinations per request
+MAX_DESTINATIONS = 25
+
+_stats = {"requests": 0, "elements": 0}
+
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _point(location):
+    return (location["lat"], location["lng"]) if location else None
+
+
+def distances_from(origin: str, destinations: List[str]) -> List[dict]:
+    """
+    Distances from origin to every destination with one distance_matrix call per 25 destinations.
+
+    origin (str) - start address
+    destinations (List[str]) - destination addresses
+
+    return (List[dict]) - one result per destination in input order with keys
+        destination, origin_address, destination_address, status,
+        distance_text, distance_meters, duration_text, duration_seconds
+    """
+    gmaps = get_gmaps_client()
+    # origin (usually the listing address) is resolved once through the geocode cache,
+    # destinations use cached coordinates when available and are resolved by Google otherwise
+    origin_location = geocode(origin)
+    results = []
+    for chunk in _chunks(list(destinations), MAX_DESTINATIONS):
+        locations = [cached_geocode(destination) for destination in chunk]
+        data = gmaps.distance_matrix(
+            _point(origin_location) or origin,
+            [_point(location) or destination for location, destination in zip(locations, chunk)],
+        )
+        _stats["requests"] += 1
+        _stats["elements"] += len(chunk)
+        origin_address = data['origin_addresses'][0] if data.get('origin_addresses') else origin
+        if origin_location:
+            origin_address = origin_location["formatted_address"]
+        elements = data['rows'][0]['elements'] if data.get('rows') else []
+        destination_addresses = data.get('destination_addresses') or []
+        for i, destination in enumerate(chunk):
+            element = elements[i] if i < len(elements) else {"status": "NOT_FOUND"}
+            if locations[i]:
+                destination_address = locations[i]["formatted_address"]
+            else:
+                destination_address = destination_addresses[i] if i < len(destination_addresses) else destination
+            results.append({
+                "destination": destination,
+                "origin_address": origin_address,
+                "destination_address": destination_address,
+                "status": element.get("status"),
+                "distance_text": element.get("distance", {}).get("text"),
+                "distance_meters": element.get("distance", {}).get("value"),
+                "duration_text": element.get("duration", {}).get("text"),
+                "duration_seconds": element.get("duration", {}).get("value"),
+            })
+    return results
+
+
+def is_found(result: dict) -> bool:
+    return result["status"] == "OK" and bool(result["distance_text"])
+
+
+def display_distance(result: dict) -> str:
+    """Distance text, with Google's '1 m' for nearly identical points replaced"""
+    if result["distance_text"] == "1 m":
+        return 'less than 200 m'
+    return result["distance_text"]
+
+
+def distance_stats() -> dict:
+    return dict(_stats)
@@ -0,0 +1,87 @@
+"""Persistent geocode cache shared by all geo helpers.
+
+Normalized address -> {"lat", "lng", "formatted_address", "place_id"}, so nearby
+homes, nearby places and distance lookups don't geocode the same free text again.
+"""
+
+import os
+import threading
+from typing import Optional
+
+import googlemaps
+
+from address_utils import normalize_address
+from blocking import run_blocking
+from cache import TTLCache
+
+geocode_cache = TTLCache(
+    "geocode",
+    maxsize=int(os.getenv("GEOCODE_CACHE_SIZE", 20000)),
+    ttl=float(os.getenv("GEOCODE_CACHE_TTL", 30 * 24 * 3600)),
+    negative_ttl=float(os.getenv("GEOCODE_CACHE_NEGATIVE_TTL", 3600)),
+    path=os.getenv("GEOCODE_CACHE_PATH"),
+)
+_MISSING = object()
+
+_client: Optional[googlemaps.Client] = None
+_client_lock = threading.Lock()
+
+
+def get_gmaps_client() -> googlemaps.Client:
+    """Shared googlemaps client, so requests reuse one HTTP session"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = googlemaps.Client(key=os.getenv('GPLACES_API_KEY'))
+        return _client
+
+
+def cached_geocode(address: str) -> Optional[dict]:
+    """Geocode of the address if it is already in cache, without calling Google"""
+    value = geocode_cache.get(normalize_address(address), _MISSING)
+    return None if value is _MISSING else value
+
+
+def geocode(address: str) -> Optional[dict]:
+    """
+    Geocode address using the cache.
+
+    address (str) - free text address
+
+    return (Optional[dict]) - lat, lng, formatted_address and place_id, or None if address wasn't found
+    """
+    key = normalize_address(address)
+    if not key:
+        return None
+    value = geocode_cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+    return _geocode_remote(key, address)
+
+
+def _geocode_remote(key: str, address: str) -> Optional[dict]:
+    results = get_gmaps_client().geocode(address)
+    if not results:
+        geocode_cache.set(key, None, negative=True)
+        return None
+    location = {
+        "lat": results[0]["geometry"]["location"]["lat"],
+        "lng": results[0]["geometry"]["location"]["lng"],
+        "formatted_address": results[0].get("formatted_address", address),
+        "place_id": results[0].get("place_id"),
+    }
+    geocode_cache.set(key, location)
+    # Google's own spelling of the address resolves from cache too
+    geocode_cache.set(normalize_address(location["formatted_address"]), location)
+    return location
+
+
+async def ageocode(address: str) -> Optional[dict]:
+    """Async variant of geocode, Google is only called on cache miss"""
+    key = normalize_address(address)
+    if not key:
+        return None
+    value = geocode_cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+    return await run_blocking(_geocode_remote, key, address)
@@ -1,23 +1,118 @@
+import asyncio
 import os
 import re
 import aiohttp
 from typing import Optional, List
 
+from cache import TTLCache
+
+# "email:<email>" / "phone:<E.164 phone>" -> locationId (None for contacts GHL answered "not found" for)
+location_id_cache = TTLCache(
+    "ghl_location",
+    maxsize=int(os.getenv("GHL_LOCATION_CACHE_SIZE", 10000)),
+    ttl=float(os.getenv("GHL_LOCATION_CACHE_TTL", 24 * 3600)),
+    negative_ttl=float(os.getenv("GHL_LOCATION_CACHE_NEGATIVE_TTL", 600)),
+)
+_MISSING = object()
+# 200 response without contacts, the only result that is cached as "not found"
+NOT_FOUND = "not found"
+
+_session: Optional[aiohttp.ClientSession] = None
+_session_loop = None
+
+
+async def get_session() -> aiohttp.ClientSession:
+    """Shared GHL session, created lazily inside the running loop"""
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        _session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=15))
+        _session_loop = loop
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+def format_phone(phone: str) -> str:
+    """Format phone number to E.164 format (e.g., +12345678900)"""
+    # Remove all non-numeric characters
+    phone_clean = re.sub(r'\D', '', phone)
+    # Add +1 if it's a 10-digit number (US/Canada)
+    if len(phone_clean) == 10:
+        phone_clean = f"+1{phone_clean}"
+    # Add + if it's an 11-digit number starting with 1
+    elif len(phone_clean) == 11 and phone_clean.startswith('1'):
+        phone_clean = f"+{phone_clean}"
+    return phone_clean
+
+
+async def _lookup_location_id(api_key: str, field: str, value: str) -> Optional[str]:
+    """Single GHL contact lookup by email or phone.
+
+    Returns locationId, NOT_FOUND for a 200 response without contacts and None on any failure
+    (non-200 status, network error, timeout, invalid JSON)."""
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    url = "https://rest.gohighlevel.com/v1/contacts/lookup"
+    try:
+        session = await get_session()
+        async with session.get(url, params={field: value}, headers=headers) as response:
+            print(f"{field.upper()} RESPONSE: ", response.status)
+            if response.status == 200:
+                data = await response.json()
+                if data and 'contacts' in data and len(data['contacts']) > 0:
+                    return data['contacts'][0]['locationId']
+                return NOT_FOUND
+            else:
+                response_text = await response.text()
+                print("ERROR RESPONSE: ", response_text)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        print(f"GHL lookup by {field} failed: {e}")
+    return None
+
+
 async def get_ghl_location_id(email: Optional[str] = None, phone: Optional[str] = None, api_keys: Optional[List[str]] = None) -> Optional[str]:
     """
     Get the location ID from GHL using either email or phone number, trying multiple API keys if provided.
-    
+
+    Results are cached per identifier. "Not found" is cached only when every API key got a
+    200 response without contacts, errors (401, 429, 5xx, timeouts) are never cached. On cache
+    miss all API key / identifier combinations are looked up concurrently and the first hit wins.
+
     Args:
         email (Optional[str]): The email address of the contact
         phone (Optional[str]): The phone number of the contact
         api_keys (Optional[List[str]]): List of API keys to try
-        
+
     Returns:
         Optional[str]: The location ID if found, None otherwise
     """
     if not email and not phone:
         return None
 
+    identifiers = []
+    if email:
+        identifiers.append(("email", email.strip().lower()))
+    if phone:
+        identifiers.append(("phone", format_phone(phone)))
+
+    missing = []
+    for field, value in identifiers:
+        cached = location_id_cache.get(f"{field}:{value}", _MISSING)
+        if cached is _MISSING:
+            missing.append((field, value))
+        elif cached is not None:
+            return cached
+    if not missing:
+        return None
+
     # Gather API keys from argument or environment
     if api_keys is None:
         api_keys = [
@@ -26,54 +121,41 @@ async def get_ghl_location_id(email: Optional[str] = None, phone: Optional[str]
         ]
     api_keys = [k for k in api_keys if k]  # Remove None values
 
-    # Try each API key in order
-    for i, api_key in enumerate(api_keys, 1):
-        print(f"\nTrying API Key #{i}")
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        # Try email first if available
-        print("EMAIL: ", email)
-        if email:
-            url = f"https://rest.gohighlevel.com/v1/contacts/lookup?email={email}"
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers) as response:
-                    print("EMAIL RESPONSE: ", response.status)
-                    if response.status == 200:
-                        data = await response.json()
-                        print("EMAIL DATA: ", data)
-                        if data and 'contacts' in data and len(data['contacts']) > 0:
-                            print(f"Successfully found Location ID using API Key #{i}")
-                            return data['contacts'][0]['locationId']
-        
-        # If email lookup failed or wasn't available, try phone
-        if phone:
-            # Format phone number to E.164 format (e.g., +12345678900)
-            # Remove all non-numeric characters
-            phone_clean = re.sub(r'\D', '', phone)
-            # Add +1 if it's a 10-digit number (US/Canada)
-            if len(phone_clean) == 10:
-                phone_clean = f"+1{phone_clean}"
-            # Add + if it's an 11-digit number starting with 1
-            elif len(phone_clean) == 11 and phone_clean.startswith('1'):
-                phone_clean = f"+{phone_clean}"
-            
-            print("FORMATTED PHONE: ", phone_clean)
-            url = f"https://rest.gohighlevel.com/v1/contacts/lookup?phone={phone_clean}"
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers) as response:
-                    print("PHONE RESPONSE: ", response.status)
-                    if response.status == 200:
-                        data = await response.json()
-                        print("PHONE DATA: ", data)
-                        if data and 'contacts' in data and len(data['contacts']) > 0:
-                            print(f"Successfully found Location ID using API Key #{i}")
-                            return data['contacts'][0]['locationId']
-                    else:
-                        response_text = await response.text()
-                        print("ERROR RESPONSE: ", response_text)
-    
-    print("No Location ID found with any API key")
-    return None
+    async def lookup(api_key, field, value):
+        return field, value, await _lookup_location_id(api_key, field, value)
+
+    lookups = [
+        asyncio.create_task(lookup(api_key, field, value))
+        for api_key in api_keys
+        for field, value in missing
+    ]
+    location_id = None
+    # identifiers with a failed lookup, "not found" of the other API keys is not reliable for them
+    failed = set()
+    try:
+        for next_lookup in asyncio.as_completed(lookups):
+            field, value, result = await next_lookup
+            if result is None:
+                failed.add((field, value))
+            elif result != NOT_FOUND:
+                location_id = result
+                break
+    finally:
+        for task in lookups:
+            task.cancel()
+
+    for field, value in missing:
+        if location_id:
+            location_id_cache.set(f"{field}:{value}", location_id)
+        elif api_keys and (field, value) not in failed:
+            location_id_cache.set(f"{field}:{value}", None, negative=True)
+    if location_id:
+        print("Successfully found Location ID: ", location_id)
+    else:
+        print("No Location ID found with any API key")
+    return location_id
+
+
+def start_ghl_location_lookup(email: Optional[str] = None, phone: Optional[str] = None) -> asyncio.Task:
+    """Start location ID lookup in background, so endpoint can do other work before awaiting it"""
+    return asyncio.create_task(get_ghl_location_id(email, phone))
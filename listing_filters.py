@@ -0,0 +1,138 @@
+"""Local filtering and ranking of agent listings against search_params.
+
+Listings are hard-filtered on price, beds, baths, sqft and home type and scored
+on keywords and location, so only the top-k compact candidates go into the prompt.
+"""
+
+import json
+import re
+from typing import Optional
+
+from listings_index import listing_address
+
+# search_params home_type enum -> Zillow home types
+HOME_TYPES = {
+    "Houses": {"SINGLE_FAMILY", "HOUSE"},
+    "Townhomes": {"TOWNHOUSE", "TOWNHOME"},
+    "Apartments": {"APARTMENT"},
+    "Condos": {"CONDO"},
+    "Multi-family": {"MULTI_FAMILY"},
+}
+
+# (param, listing fields) pairs of hard numeric filters
+RANGE_FILTERS = [
+    ("minPrice", "maxPrice", "price"),
+    ("bedsMin", "bedsMax", "beds"),
+    ("bathsMin", "bathsMax", "baths"),
+    ("sqftMin", "sqftMax", "sqft"),
+]
+
+
+def _number(value) -> Optional[float]:
+    if isinstance(value, dict):
+        value = value.get("value")
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        digits = re.sub(r"[^\d.]", "", value)
+        try:
+            return float(digits) if digits else None
+        except ValueError:
+            return None
+    return None
+
+
+def _first(listing: dict, *fields):
+    for field in fields:
+        value = _number(listing.get(field))
+        if value is not None:
+            return value
+    return None
+
+
+def listing_fields(listing: dict) -> dict:
+    """Read price, beds, baths, sqft and home type from agentActiveListings item"""
+    home_type = listing.get("home_type") or listing.get("homeType") or listing.get("propertyType") or ""
+    return {
+        "price": _first(listing, "price", "listPrice", "unformattedPrice"),
+        "beds": _first(listing, "bedrooms", "beds"),
+        "baths": _first(listing, "bathrooms", "baths"),
+        "sqft": _first(listing, "livingArea", "livingAreaValue", "sqft"),
+        "home_type": str(home_type).upper().replace(" ", "_"),
+    }
+
+
+def compact_listing(listing: dict) -> dict:
+    """Short listing representation for the prompt. Address stays in 'line1, line2' format used by photo keys"""
+    fields = listing_fields(listing)
+    compact = {"address": listing_address(listing)}
+    for key, value in fields.items():
+        if value:
+            compact[key] = int(value) if isinstance(value, float) and value.is_integer() else value
+    url = listing.get("url") or listing.get("detailUrl")
+    if url:
+        compact["url"] = url
+    return compact
+
+
+def normalize_search_params(params: dict) -> dict:
+    """
+    Fix ranges of search_params function call arguments, shared by the Zillow search and local filtering.
+
+    A lone minPrice is read as the upper bound ("homes under $500k"), a lone beds/baths bound
+    is mirrored to the other side.
+    """
+    params = dict(params)
+    if params.get("minPrice") and not params.get("maxPrice"):
+        params["maxPrice"] = params.pop("minPrice")
+    if params.get("minPrice") and params.get("minPrice") == params.get("maxPrice"):
+        params.pop("minPrice")
+    if params.get("bedsMin") and not params.get("bedsMax"):
+        params["bedsMax"] = params.get("bedsMin")
+    elif params.get("bedsMax") and not params.get("bedsMin"):
+        params["bedsMin"] = params.get("bedsMax")
+
+    if params.get("bathsMin") and not params.get("bathsMax"):
+        params["bathsMax"] = params.get("bathsMin")
+    elif params.get("bathsMax") and not params.get("bathsMin"):
+        params["bathsMin"] = params.get("bathsMax")
+    return params
+
+
+def _matches(fields: dict, params: dict) -> bool:
+    for min_param, max_param, field in RANGE_FILTERS:
+        value = fields[field]
+        if value is None:
+            # unknown values don't exclude the listing
+            continue
+        low, high = _number(params.get(min_param)), _number(params.get(max_param))
+        if low is not None and value < low:
+            return False
+        if high is not None and value > high:
+            return False
+    wanted = HOME_TYPES.get(params.get("home_type"))
+    if wanted and fields["home_type"] and fields["home_type"] not in wanted:
+        return False
+    return True
+
+
+def _score(listing: dict, params: dict) -> float:
+    text = json.dumps(listing, default=str).lower()
+    score = 0.0
+    keywords = [word for word in re.split(r"[,;]\s*|\s+and\s+", (params.get("keywords") or "").lower()) if word.strip()]
+    score += sum(1.0 for word in keywords if word.strip() in text)
+    city = (params.get("location") or "").split(",")[0].strip().lower()
+    if city and city in listing_address(listing).lower():
+        score += 2.0
+    if listing.get("primary_photo_url"):
+        score += 0.1
+    return score
+
+
+def rank_listings(listings: list, params: dict, top_k: int = 5) -> list:
+    """Filter listings by search params and return top_k compact candidates, best first"""
+    params = normalize_search_params(params)
+    candidates = [el for el in listings if _matches(listing_fields(el), params)]
+    # stable sort keeps agent's original order for equal scores
+    candidates.sort(key=lambda el: _score(el, params), reverse=True)
+    return [compact_listing(el) for el in candidates[:top_k]]
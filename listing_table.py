@@ -0,0 +1,108 @@
+"""Compact table encoding of listing arrays for prompts.
+
+A list of listing dicts rendered with str() repeats every key in every row. Here it
+is rendered as one header line and one line per listing, nested dicts are flattened
+into dotted columns and columns empty in every row are left out:
+
+    address|price|bedrooms|location.city
+    1 Main St, Austin, TX 78701|450000|3|Austin
+
+LISTING_PROMPT_FORMAT=repr switches back to str() of the list. Tokens of both forms
+are counted per prompt name and shown on /metrics.
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from token_budget import payload_size
+
+LISTING_PROMPT_FORMAT = os.getenv("LISTING_PROMPT_FORMAT", "table")
+SEPARATOR = "|"
+
+_stats_lock = threading.Lock()
+table_stats: Dict[str, dict] = {}
+
+
+def _number(value: float) -> str:
+    if value.is_integer():
+        return str(int(value))
+    return f"{round(value, 6):f}".rstrip("0")
+
+
+def format_value(value: Any) -> str:
+    """Cell text: integral floats without '.0', lists joined with '; ', no separators or line breaks"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float):
+        return _number(value)
+    if isinstance(value, list):
+        if all(not isinstance(element, (dict, list)) for element in value):
+            return "; ".join(format_value(element) for element in value)
+        value = json.dumps(value, separators=(",", ":"), default=str)
+    text = " ".join(str(value).split())
+    return text.replace(SEPARATOR, "/")
+
+
+def _flatten(listing: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in listing.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def is_listing_array(value: Any) -> bool:
+    return isinstance(value, list) and bool(value) and all(isinstance(element, dict) for element in value)
+
+
+def to_table(listings: List[dict], columns: Optional[List[str]] = None) -> str:
+    """Header plus one row per listing. columns defaults to all non-empty columns in first seen order"""
+    rows = [_flatten(listing) for listing in listings]
+    if columns is None:
+        columns = []
+        for row in rows:
+            for key, value in row.items():
+                if key not in columns and value not in (None, "", [], {}):
+                    columns.append(key)
+    lines = [SEPARATOR.join(columns)]
+    lines += [SEPARATOR.join(format_value(row.get(column)) for column in columns) for row in rows]
+    return "\n".join(lines)
+
+
+def _record(name: str, before: tuple, after: tuple):
+    with _stats_lock:
+        stats = table_stats.setdefault(
+            name, {"calls": 0, "bytes_before": 0, "bytes_after": 0, "tokens_before": 0, "tokens_after": 0}
+        )
+        stats["calls"] += 1
+        stats["bytes_before"] += before[0]
+        stats["bytes_after"] += after[0]
+        stats["tokens_before"] += before[1]
+        stats["tokens_after"] += after[1]
+
+
+def encode_listings(listings: Any, name: str) -> str:
+    """
+    Prompt text of listings. Anything that isn't a non-empty list of dicts (i.e error message) is
+    returned as str().
+
+    name (str) - prompt the listings go to, key of the /metrics counters
+    """
+    if LISTING_PROMPT_FORMAT != "table" or not is_listing_array(listings):
+        return str(listings)
+    table = to_table(listings)
+    before, after = payload_size(listings), payload_size(table)
+    _record(name, before, after)
+    print(f"LISTING_TABLE {name}: {len(listings)} rows, {before[1]} -> {after[1]} tokens")
+    return table
+
+
+def listing_tables_stats() -> dict:
+    with _stats_lock:
+        return {name: dict(stats) for name, stats in table_stats.items()}
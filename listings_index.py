@@ -0,0 +1,188 @@
+"""Per-agent index of active Zillow listings shared by all callers.
+
+Listings are loaded with concurrent agentActiveListings page requests, looked up
+by zpid or normalized address, and refreshed in background once they get stale.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from address_utils import normalize_address
+from cache import StaleWhileRevalidateCache
+from rate_limiter import rapidapi_get
+from zillow_client import zillow_client
+
+PAGE_SIZE = int(os.getenv("AGENT_LISTINGS_PAGE_SIZE", 20))
+PAGE_CONCURRENCY = int(os.getenv("AGENT_LISTINGS_PAGE_CONCURRENCY", 4))
+
+_page_executor = ThreadPoolExecutor(max_workers=PAGE_CONCURRENCY, thread_name_prefix="agent-listings")
+
+
+def listing_address(listing: dict) -> str:
+    """Address of agentActiveListings item in the same format as photo keys: 'line1, line2'"""
+    address = listing.get("address") or {}
+    return f'{address.get("line1", "")}, {address.get("line2", "")}'
+
+
+class AgentListings:
+    """Active listings of one agent with zpid and normalized address lookups. Treat as read-only.
+
+    complete is False when a page failed to load, such listings are served but never cached.
+    """
+
+    def __init__(self, zuid: str, listings: list, complete: bool = True):
+        self.zuid = zuid
+        self.listings = listings
+        self.complete = complete
+        self.by_zpid = {str(el["zpid"]): el for el in listings if el.get("zpid")}
+        self.by_address = {normalize_address(listing_address(el)): el for el in listings}
+        self.photos = {
+            listing_address(el): el["primary_photo_url"]
+            for el in listings
+            if "primary_photo_url" in el
+        }
+
+    def get_by_zpid(self, zpid) -> Optional[dict]:
+        return self.by_zpid.get(str(zpid))
+
+    def get_by_address(self, address: str) -> Optional[dict]:
+        return self.by_address.get(normalize_address(address))
+
+    def match(self, homes: list) -> list:
+        """Return homes (search results with zpid) that are listed by the agent"""
+        return [el for el in homes if isinstance(el, dict) and str(el.get("zpid")) in self.by_zpid]
+
+    def as_result(self) -> dict:
+        """Format used by get_agent_listings callers"""
+        return {"res": self.listings, "photos": self.photos}
+
+
+def _page_listings(status: int, data) -> Optional[list]:
+    """Listings of the page, None if the page failed (429 after retries, 5xx, ...)"""
+    if status != 200 or not isinstance(data, dict):
+        print(f"AGENT_LISTINGS_PAGE_FAILED: status {status}")
+        return None
+    return data.get("listings", [])
+
+
+def _fetch_page(zuid: str, page: int) -> Optional[list]:
+    querystring = {"zuid": zuid, "page": str(page), "size": str(PAGE_SIZE)}
+    headers = {
+        "X-RapidAPI-Key": os.getenv("X-RapidAPI-Key"),
+        "X-RapidAPI-Host": "zillow-com1.p.rapidapi.com"
+    }
+    response = rapidapi_get("https://zillow-com1.p.rapidapi.com/agentActiveListings", headers=headers, params=querystring)
+    try:
+        data = response.json()
+    except ValueError:
+        data = None
+    return _page_listings(response.status_code, data)
+
+
+async def _afetch_page(zuid: str, page: int) -> Optional[list]:
+    querystring = {"zuid": zuid, "page": str(page), "size": str(PAGE_SIZE)}
+    status, data = await zillow_client.get("agentActiveListings", querystring)
+    return _page_listings(status, data)
+
+
+def _collect(pages: list, all_listings: list) -> Optional[bool]:
+    """Add pages of one batch to all_listings, return True if the last page was reached,
+    None if a page failed and the rest of the listings is unknown"""
+    for lis in pages:
+        if lis is None:
+            return None
+        all_listings.extend(lis)
+        # fewer than PAGE_SIZE listings means the last page
+        if len(lis) < PAGE_SIZE:
+            return True
+    return False
+
+
+def load_agent_listings(zuid: str) -> AgentListings:
+    """Fetch all pages of agent listings. Page 1 is fetched alone, so agents with one page
+    cost one request, further pages PAGE_CONCURRENCY at a time"""
+    all_listings = []
+    last_page = _collect([_fetch_page(zuid, 1)], all_listings)
+    first_page = 2
+    while last_page is False:
+        pages = list(_page_executor.map(
+            lambda page: _fetch_page(zuid, page), range(first_page, first_page + PAGE_CONCURRENCY)
+        ))
+        last_page = _collect(pages, all_listings)
+        first_page += PAGE_CONCURRENCY
+    print(f"Total listings retrieved: {len(all_listings)}")
+    return AgentListings(zuid, all_listings, complete=last_page is True)
+
+
+async def aload_agent_listings(zuid: str) -> AgentListings:
+    """Async variant of load_agent_listings"""
+    all_listings = []
+    last_page = _collect([await _afetch_page(zuid, 1)], all_listings)
+    first_page = 2
+    while last_page is False:
+        pages = await asyncio.gather(
+            *[_afetch_page(zuid, page) for page in range(first_page, first_page + PAGE_CONCURRENCY)]
+        )
+        last_page = _collect(pages, all_listings)
+        first_page += PAGE_CONCURRENCY
+    print(f"Total listings retrieved: {len(all_listings)}")
+    return AgentListings(zuid, all_listings, complete=last_page is True)
+
+
+def _is_complete(listings: AgentListings) -> bool:
+    # partial listings are not cached, a cached entry stays until a full load succeeds
+    return listings.complete
+
+
+class AgentListingsIndex:
+    """zuid -> AgentListings. Stale entries are served at once and reloaded in background.
+
+    Args:
+        fresh_ttl (float): Seconds after which listings are refreshed in background
+        max_age (float): Seconds after which listings are reloaded before answering
+    """
+
+    def __init__(self, fresh_ttl: float = 600, max_age: float = 6 * 3600):
+        self._cache = StaleWhileRevalidateCache(
+            "agent_listings", fresh_ttl=fresh_ttl, max_age=max_age, copy_values=False
+        )
+        self._loading = {}  # zuid -> task, so concurrent requests share one cold load
+
+    def _log_changes(self, zuid: str, listings: AgentListings):
+        previous = self._cache.peek(zuid)
+        if previous is not None and listings.complete:
+            added = listings.by_zpid.keys() - previous.by_zpid.keys()
+            removed = previous.by_zpid.keys() - listings.by_zpid.keys()
+            if added or removed:
+                print(f"AGENT_LISTINGS {zuid}: {len(added)} added, {len(removed)} removed")
+        return listings
+
+    def get(self, zuid: str) -> AgentListings:
+        return self._cache.get_or_load(
+            zuid, lambda: self._log_changes(zuid, load_agent_listings(zuid)), should_cache=_is_complete
+        )
+
+    async def aget(self, zuid: str) -> AgentListings:
+        async def load():
+            if zuid not in self._loading:
+                self._loading[zuid] = asyncio.ensure_future(aload_agent_listings(zuid))
+            try:
+                return self._log_changes(zuid, await asyncio.shield(self._loading[zuid]))
+            finally:
+                if self._loading.get(zuid) is not None and self._loading[zuid].done():
+                    del self._loading[zuid]
+        return await self._cache.aget_or_load(zuid, load, should_cache=_is_complete)
+
+    def invalidate(self, zuid: str):
+        self._cache.delete(zuid)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+agent_listings_index = AgentListingsIndex(
+    fresh_ttl=float(os.getenv("AGENT_LISTINGS_FRESH_TTL", 600)),
+    max_age=float(os.getenv("AGENT_LISTINGS_MAX_AGE", 6 * 3600)),
+)
@@ -0,0 +1,83 @@
+"""Exact-match cache of LLM responses for deterministic helper prompts.
+
+Key is a hash of the model, sampling parameters and prompt content. Calls with
+temperature above LLM_CACHE_MAX_TEMPERATURE bypass the cache, since their answers
+are not meant to repeat.
+
+    query = await acached_chat(llm_helper, messages)
+"""
+
+import hashlib
+import json
+import os
+from typing import Any, Awaitable, Callable, List
+
+from blocking import run_blocking
+from cache import TTLCache
+
+MAX_TEMPERATURE = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", 0.0))
+
+llm_cache = TTLCache(
+    "llm_responses",
+    maxsize=int(os.getenv("LLM_CACHE_SIZE", 2000)),
+    ttl=float(os.getenv("LLM_CACHE_TTL", 24 * 3600)),
+    path=os.getenv("LLM_CACHE_PATH"),
+)
+_stats = {"bypassed": 0}
+
+
+def cache_key(parts: dict) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _messages_key(llm, messages: List) -> dict:
+    return {
+        "model": llm.model_name,
+        "temperature": llm.temperature,
+        "max_tokens": llm.max_tokens,
+        "messages": [(message.type, message.content) for message in messages],
+    }
+
+
+def cached_call(parts: dict, temperature: float, call: Callable[[], Any]) -> Any:
+    """Return cached result of call for the same parts, calling it on miss. Result must be JSON serializable"""
+    if temperature > MAX_TEMPERATURE:
+        _stats["bypassed"] += 1
+        return call()
+    key = cache_key(parts)
+    result = llm_cache.get(key)
+    if result is None:
+        result = call()
+        llm_cache.set(key, result)
+    return result
+
+
+async def acached_call(parts: dict, temperature: float, call: Callable[[], Awaitable[Any]]) -> Any:
+    """Async variant of cached_call"""
+    if temperature > MAX_TEMPERATURE:
+        _stats["bypassed"] += 1
+        return await call()
+    key = cache_key(parts)
+    result = llm_cache.get(key)
+    if result is None:
+        result = await call()
+        llm_cache.set(key, result)
+    return result
+
+
+def cached_chat(llm, messages: List) -> str:
+    """Content of llm(messages) answer (LangChain chat model), cached"""
+    return cached_call(_messages_key(llm, messages), llm.temperature, lambda: llm(messages).content)
+
+
+async def acached_chat(llm, messages: List) -> str:
+    """Async variant of cached_chat, LLM is called in the blocking pool"""
+    async def call():
+        return (await run_blocking(llm, messages)).content
+    return await acached_call(_messages_key(llm, messages), llm.temperature, call)
+
+
+def llm_cache_stats() -> dict:
+    stats = llm_cache.stats()
+    stats.update(_stats)
+    return stats
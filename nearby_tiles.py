@@ -0,0 +1,205 @@
+"""Geohash-tiled cache of propertyByCoordinates results.
+
+Homes around the center of a geohash tile are fetched once with a radius that
+covers the whole tile plus the search radius, so every query whose center falls
+into the tile (or is covered by a cached neighbor tile) is answered locally by
+merging the cached tiles and filtering by exact distance.
+"""
+
+import math
+import os
+from typing import List, Optional, Tuple
+
+from cache import TTLCache
+from rate_limiter import rapidapi_get
+from zillow_client import zillow_client
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+EARTH_RADIUS_MILES = 3958.8
+
+
+def geohash_encode(lat: float, lng: float, precision: int) -> str:
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    bits, bit, even, geohash = 0, 0, True, []
+    while len(geohash) < precision:
+        value, rng = (lng, lng_range) if even else (lat, lat_range)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            rng[0] = mid
+        else:
+            bits = bits * 2
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            geohash.append(_BASE32[bits])
+            bits, bit = 0, 0
+    return "".join(geohash)
+
+
+def geohash_bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """return (Tuple) - min_lat, max_lat, min_lng, max_lng of the tile"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = _BASE32.index(char)
+        for shift in range(4, -1, -1):
+            rng = lng_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (value >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lat_range[1], lng_range[0], lng_range[1]
+
+
+def tile_center(geohash: str) -> Tuple[float, float]:
+    min_lat, max_lat, min_lng, max_lng = geohash_bounds(geohash)
+    return (min_lat + max_lat) / 2, (min_lng + max_lng) / 2
+
+
+def neighbor_tiles(geohash: str) -> List[str]:
+    """Tile itself and its 8 neighbors"""
+    min_lat, max_lat, min_lng, max_lng = geohash_bounds(geohash)
+    lat, lng = (min_lat + max_lat) / 2, (min_lng + max_lng) / 2
+    d_lat, d_lng = max_lat - min_lat, max_lng - min_lng
+    tiles = []
+    for i in (0, -1, 1):
+        for j in (0, -1, 1):
+            tile = geohash_encode(max(-90.0, min(90.0, lat + i * d_lat)), (lng + j * d_lng + 180) % 360 - 180, len(geohash))
+            if tile not in tiles:
+                tiles.append(tile)
+    return tiles
+
+
+def haversine_miles(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return EARTH_RADIUS_MILES * 2 * math.asin(math.sqrt(a))
+
+
+def _tile_half_diagonal(geohash: str) -> float:
+    min_lat, max_lat, min_lng, max_lng = geohash_bounds(geohash)
+    return haversine_miles(min_lat, min_lng, max_lat, max_lng) / 2
+
+
+def _on_market_properties(data) -> list:
+    on_market_property = []
+    for element in data if isinstance(data, list) else []:
+        element = element.get("property")
+        if element and element.get("homeStatus") != "OTHER":
+            on_market_property.append(element)
+    return on_market_property
+
+
+class NearbyHomesTiles:
+    """Cache of on-market homes per geohash tile.
+
+    Args:
+        precision (int): Geohash length of tiles, 6 is about 1.2 x 0.6 km
+        ttl (float): Lifetime of tile in seconds
+        max_radius (float): Largest query radius (miles) a tile has to answer
+    """
+
+    def __init__(self, precision: int = 6, ttl: float = 600, max_radius: float = 0.5, maxsize: int = 2000):
+        self.precision = precision
+        self.max_radius = max_radius
+        self._cache = TTLCache("nearby_tiles", maxsize=maxsize, ttl=ttl)
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+
+    def _fetch_radius(self, tile: str) -> float:
+        return round(self.max_radius + _tile_half_diagonal(tile), 2)
+
+    def _covering(self, lat: float, lng: float, radius: float) -> Tuple[str, bool, list]:
+        """Own tile of the point, whether cached tiles cover the query circle and homes of these tiles"""
+        own_tile = geohash_encode(lat, lng, self.precision)
+        covered, homes = False, []
+        for tile in neighbor_tiles(own_tile):
+            # only the own tile counts as cache hit/miss, neighbours are just probed
+            cached = self._cache.get(tile) if tile == own_tile else self._cache.peek(tile)
+            if cached is None:
+                continue
+            center_lat, center_lng = tile_center(tile)
+            if haversine_miles(lat, lng, center_lat, center_lng) + radius <= cached["radius"]:
+                covered = True
+                homes.extend(cached["homes"])
+        return own_tile, covered, homes
+
+    def _store(self, tile: str, radius: float, status: int, data) -> list:
+        homes = _on_market_properties(data)
+        self.upstream_calls += 1
+        if status != 200 or not isinstance(data, list):
+            # errors are not cached, otherwise the whole tile would report no homes for ttl
+            self.upstream_errors += 1
+            print(f"NEARBY_TILE_NOT_CACHED: status {status} for {tile}")
+            return homes
+        self._cache.set(tile, {"radius": radius, "homes": homes})
+        return homes
+
+    def _fetch_tile(self, tile: str) -> list:
+        lat, lng = tile_center(tile)
+        radius = self._fetch_radius(tile)
+        querystring = {"long": lng, "lat": lat, "d": str(radius), "includeSold": "false"}
+        headers = {
+            "X-RapidAPI-Key": os.getenv("X-RapidAPI-Key"),
+            "X-RapidAPI-Host": "zillow-com1.p.rapidapi.com"
+        }
+        response = rapidapi_get("https://zillow-com1.p.rapidapi.com/propertyByCoordinates", headers=headers, params=querystring)
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+        return self._store(tile, radius, response.status_code, data)
+
+    async def _afetch_tile(self, tile: str) -> list:
+        lat, lng = tile_center(tile)
+        radius = self._fetch_radius(tile)
+        querystring = {"long": lng, "lat": lat, "d": str(radius), "includeSold": "false"}
+        status, data = await zillow_client.get("propertyByCoordinates", querystring)
+        return self._store(tile, radius, status, data)
+
+    def _within(self, homes: list, lat: float, lng: float, radius: float) -> list:
+        """Deduplicate merged tiles by zpid and keep homes within radius of the point"""
+        result, seen = [], set()
+        for home in homes:
+            key = home.get("zpid") or id(home)
+            if key in seen:
+                continue
+            seen.add(key)
+            home_lat, home_lng = home.get("latitude"), home.get("longitude")
+            if home_lat is not None and home_lng is not None and haversine_miles(lat, lng, home_lat, home_lng) > radius:
+                continue
+            result.append(home)
+        return result
+
+    def get(self, lat: float, lng: float, radius: Optional[float] = None) -> list:
+        """On-market homes within radius (miles) of the point"""
+        radius = min(radius or self.max_radius, self.max_radius)
+        own_tile, covered, homes = self._covering(lat, lng, radius)
+        if not covered:
+            homes = self._fetch_tile(own_tile)
+        return self._within(homes, lat, lng, radius)
+
+    async def aget(self, lat: float, lng: float, radius: Optional[float] = None) -> list:
+        """Async variant of get"""
+        radius = min(radius or self.max_radius, self.max_radius)
+        own_tile, covered, homes = self._covering(lat, lng, radius)
+        if not covered:
+            homes = await self._afetch_tile(own_tile)
+        return self._within(homes, lat, lng, radius)
+
+    def stats(self) -> dict:
+        stats = self._cache.stats()
+        stats["upstream_calls"] = self.upstream_calls
+        stats["upstream_errors"] = self.upstream_errors
+        return stats
+
+
+nearby_tiles = NearbyHomesTiles(
+    precision=int(os.getenv("NEARBY_TILE_PRECISION", 6)),
+    ttl=float(os.getenv("NEARBY_TILE_TTL", 600)),
+    max_radius=float(os.getenv("NEARBY_HOMES_RADIUS_MILES", 0.5)),
+)
@@ -0,0 +1,148 @@
+"""Local extraction of the searched place from user message.
+
+Fast path before the few-shot "extract specific places from user query" LLM prompt:
+a lexicon of POI categories and brands plus simple proper noun rules. Returns the
+place in the user's own wording and a confidence, the LLM is asked only when the
+confidence is low.
+
+    >>> extract_places("Is the house close to any high schools?")
+    ('high schools', 0.9)
+"""
+
+import os
+import re
+from typing import List, Optional, Tuple
+
+NO_PLACES = "There are no specific places in user query"
+MIN_CONFIDENCE = float(os.getenv("PLACE_EXTRACTOR_MIN_CONFIDENCE", 0.8))
+
+# POI categories, singular forms. Multi-word entries win over their last word ("high school" over "school").
+# Words that usually mean something else in real estate questions ("market value", "pool") are left out
+CATEGORIES = {
+    "school", "high school", "middle school", "elementary school", "primary school", "private school",
+    "public school", "preschool", "daycare", "kindergarten", "university", "college",
+    "hospital", "clinic", "urgent care", "pharmacy", "drugstore", "doctor", "dentist", "vet",
+    "grocery", "grocery store", "supermarket", "store", "shop", "coffee shop", "mall", "shopping mall",
+    "shopping center", "farmers market", "bakery", "restaurant", "cafe", "coffee", "bar", "pub",
+    "brewery", "winery", "pizza", "fast food",
+    "park", "dog park", "playground", "beach", "lake", "trail", "hiking trail", "golf course", "gym",
+    "fitness center", "swimming pool", "stadium", "arena", "museum", "theater", "theatre",
+    "movie theater", "cinema", "library", "zoo", "casino",
+    "bank", "atm", "post office", "gas station", "car wash", "police station", "fire station",
+    "church", "mosque", "synagogue", "temple",
+    "airport", "train station", "bus stop", "bus station", "subway", "subway station", "metro",
+    "highway", "freeway", "hotel",
+}
+BRANDS = {
+    "starbucks", "walmart", "costco", "whole foods", "trader joe's", "trader joes", "dunkin",
+    "dunkin donuts", "mcdonald's", "mcdonalds", "cvs", "walgreens", "home depot", "lowe's", "kroger",
+    "safeway", "publix", "aldi", "chipotle", "in-n-out", "sprouts", "h-e-b", "heb", "ralphs", "vons",
+    "albertsons", "wegmans", "chick-fil-a", "subway", "planet fitness", "la fitness",
+}
+# capitalized words that end a proper noun place name ("Angel Stadium", "Central Park")
+PLACE_SUFFIXES = {
+    "stadium", "park", "mall", "school", "hospital", "center", "centre", "airport", "station",
+    "university", "college", "beach", "lake", "museum", "theater", "theatre", "arena", "library",
+    "church", "market", "plaza", "square", "zoo", "club", "course", "field", "hall", "tower", "bridge",
+}
+# categories that are also parts or features of a house ("park two cars", "basement bar", "store room",
+# "swimming pool in the backyard"), a single hit of them is trusted only next to a proximity cue
+AMBIGUOUS = {"park", "bar", "store", "swimming pool", "bank", "theater", "theatre", "gym", "library", "coffee"}
+PROXIMITY_RE = re.compile(
+    r"\b(near|nearby|nearest|close|closer|closest|around|distance|far|area|walk|walking|drive|driving|minutes?|within)\b",
+    re.IGNORECASE,
+)
+GREETINGS = {
+    "hi", "hello", "hey", "thanks", "thank you", "ok", "okay", "yes", "no", "good morning",
+    "good afternoon", "good evening", "bye", "great", "cool",
+}
+# words that start a sentence or are capitalized without being a place name
+NOT_PROPER = {"i", "i'd", "i'm", "i'll", "i've", "is", "are", "any", "the", "what", "which", "who", "when", "why",
+              "where", "how", "can", "could", "would", "will", "should", "do", "does", "did", "has", "have",
+              "tell", "show", "find", "list", "give", "there", "hello", "hi", "hey", "thanks", "please", "and",
+              "or", "but", "also", "near", "by", "to", "in", "at", "for", "hoa", "hvac", "ac", "adu", "mls"}
+
+
+def _plural_forms(phrase: str) -> List[str]:
+    last = phrase.split()[-1]
+    if last.endswith("y") and not last.endswith(("ay", "ey", "oy")):
+        plural = last[:-1] + "ies"
+    elif last.endswith(("s", "sh", "ch", "x")):
+        plural = last + "es"
+    else:
+        plural = last + "s"
+    return [phrase, phrase[: -len(last)] + plural]
+
+
+# longest phrases first, so "high schools" is found before "schools"
+_LEXICON = sorted(
+    {form for phrase in CATEGORIES for form in _plural_forms(phrase)} | BRANDS,
+    key=len, reverse=True,
+)
+_AMBIGUOUS_FORMS = {form for phrase in AMBIGUOUS for form in _plural_forms(phrase)}
+_LEXICON_RE = re.compile(r"(?<![\w'])(" + "|".join(re.escape(term) for term in _LEXICON) + r")(?![\w'])", re.IGNORECASE)
+_PROPER_RE = re.compile(r"\b([A-Z][\w'\-]*(?:\s+(?:of\s+|the\s+|&\s+)?[A-Z][\w'\-]*)*)")
+
+
+def _proper_nouns(message: str) -> List[str]:
+    names = []
+    for match in _PROPER_RE.finditer(message):
+        words = match.group(1).split()
+        # drop capitalized helper words at the start, i.e "Is Angel Stadium" -> "Angel Stadium"
+        while words and words[0].lower() in NOT_PROPER:
+            words.pop(0)
+        # a lone capitalized word starting a sentence is just capitalization ("Tell me ...")
+        sentence_start = not message[: match.start()].strip() or message[: match.start()].rstrip()[-1] in ".!?"
+        if sentence_start and len(words) == 1 and len(match.group(1).split()) == 1:
+            continue
+        if words:
+            names.append(" ".join(words))
+    return names
+
+
+def extract_places(message: str) -> Tuple[Optional[str], float]:
+    """
+    Extract searched place from user message.
+
+    message (str) - user message, i.e "Are there any shops?"
+
+    return (Tuple[Optional[str], float]) - place in user's wording (or NO_PLACES) and confidence 0..1,
+        (None, 0.0) when the message can't be handled locally
+    """
+    text = (message or "").strip()
+    if not text:
+        return NO_PLACES, 1.0
+    if re.sub(r"[^\w\s']", "", text).strip().lower() in GREETINGS:
+        return NO_PLACES, 0.95
+
+    found = []
+    for match in _LEXICON_RE.finditer(text):
+        term = match.group(1)
+        if term.lower() not in (f.lower() for f in found):
+            found.append(term)
+
+    # named places: capitalized phrase ending with a place word ("Angel Stadium")
+    named = [
+        name for name in _proper_nouns(text)
+        if len(name.split()) > 1 and name.split()[-1].lower() in PLACE_SUFFIXES
+    ]
+    if named:
+        others = [term for term in found if not any(term.lower() in name.lower() for name in named)]
+        confidence = 0.9 if len(named) == 1 and not others else 0.6
+        return ", ".join(named + others), confidence
+    names = [name for name in _proper_nouns(text) if name.lower() not in (f.lower() for f in found)]
+
+    if len(found) == 1 and not names:
+        if found[0].lower() in _AMBIGUOUS_FORMS and not PROXIMITY_RE.search(text):
+            # "Can I park two cars in the garage?", let the LLM decide
+            return found[0], 0.6
+        return found[0], 0.9
+    if found and not names:
+        # several categories, the LLM may phrase the combination differently
+        return ", ".join(found), 0.7
+    if names:
+        # unknown proper noun, i.e "Disneyland" or a street name, let the LLM decide
+        return names[0], 0.5
+    if len(text.split()) <= 3:
+        return NO_PLACES, 0.6
+    return None, 0.0
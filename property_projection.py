@@ -0,0 +1,106 @@
+"""Allow-list projection of Zillow /property documents per use case.
+
+The full document is tens of KB (nearby homes, photos in every resolution, listing
+agents, ...), tools only need a small part of it in the prompt. Every use case keeps
+the fields listed in PROJECTIONS and drops everything else:
+
+    "address"             - whole value of the key
+    "resoFacts.heating"   - key of nested dict
+    "schools[].rating"    - key of every element of a list
+
+Sizes before and after are counted per use case and shown on /metrics.
+"""
+
+import threading
+from typing import Any, Dict, List
+
+from token_budget import payload_size
+
+PROJECTIONS: Dict[str, List[str]] = {
+    "details": [
+        "zpid", "address", "streetAddress", "city", "state", "zipcode", "county", "latitude", "longitude",
+        "price", "currency", "pricePerSquareFoot", "priceChange", "datePriceChanged", "zestimate", "rentZestimate",
+        "lastSoldPrice", "dateSold", "taxAssessedValue", "taxAssessedYear", "homeStatus", "homeType",
+        "bedrooms", "bathrooms", "livingArea", "livingAreaUnits", "lotSize", "lotAreaValue", "lotAreaUnits",
+        "yearBuilt", "description", "daysOnZillow", "openHouseSchedule", "brokerageName", "monthlyHoaFee",
+        "propertyTaxRate", "hdpUrl", "imgSrc",
+        "resoFacts.heating", "resoFacts.cooling", "resoFacts.parkingFeatures", "resoFacts.garageParkingCapacity",
+        "resoFacts.appliances", "resoFacts.flooring", "resoFacts.laundryFeatures", "resoFacts.basement",
+        "resoFacts.poolFeatures", "resoFacts.fireplaces", "resoFacts.stories", "resoFacts.view",
+        "resoFacts.hoaFee", "resoFacts.associationFee", "resoFacts.taxAnnualAmount",
+        "resoFacts.architecturalStyle", "resoFacts.roofType", "resoFacts.sewer", "resoFacts.waterSource",
+        "schools[].name", "schools[].rating", "schools[].level", "schools[].grades",
+        "schools[].distance", "schools[].type", "schools[].link",
+    ],
+    "tax": [
+        "price", "currency", "zestimate", "propertyTaxRate",
+        "taxHistory[].time", "taxHistory[].taxPaid", "taxHistory[].taxIncreaseRate",
+        "taxHistory[].value", "taxHistory[].valueIncreaseRate",
+        "priceHistory[].time", "priceHistory[].event", "priceHistory[].price",
+        "priceHistory[].priceChangeRate", "priceHistory[].pricePerSquareFoot",
+    ],
+}
+
+
+def _tree(paths: List[str]) -> dict:
+    """["a.b", "c[].d"] -> {"a": {"b": None}, "c": {"d": None}}, None keeps the whole value"""
+    tree = {}
+    for path in paths:
+        node = tree
+        parts = path.replace("[]", "").split(".")
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+            if node is None:
+                break
+        else:
+            node.setdefault(parts[-1], None)
+    return tree
+
+
+_TREES = {use_case: _tree(paths) for use_case, paths in PROJECTIONS.items()}
+
+
+def _project(value: Any, tree: dict) -> Any:
+    if isinstance(value, list):
+        return [_project(element, tree) for element in value]
+    if not isinstance(value, dict):
+        return value
+    projected = {}
+    for key, subtree in tree.items():
+        if key in value and value[key] is not None:
+            projected[key] = value[key] if subtree is None else _project(value[key], subtree)
+    return projected
+
+
+_stats_lock = threading.Lock()
+projection_stats: Dict[str, dict] = {}
+
+
+def _record(use_case: str, before: tuple, after: tuple):
+    with _stats_lock:
+        stats = projection_stats.setdefault(
+            use_case, {"calls": 0, "bytes_before": 0, "bytes_after": 0, "tokens_before": 0, "tokens_after": 0}
+        )
+        stats["calls"] += 1
+        stats["bytes_before"] += before[0]
+        stats["bytes_after"] += after[0]
+        stats["tokens_before"] += before[1]
+        stats["tokens_after"] += after[1]
+
+
+def project(document: dict, use_case: str) -> dict:
+    """
+    Keep only fields of the use case (see PROJECTIONS) in /property document.
+
+    Returns a new dict, document itself is not changed.
+    """
+    projected = _project(document, _TREES[use_case])
+    before, after = payload_size(document), payload_size(projected)
+    _record(use_case, before, after)
+    print(f"PROJECTION {use_case}: {before[0]} -> {after[0]} bytes, {before[1]} -> {after[1]} tokens")
+    return projected
+
+
+def projections_stats() -> dict:
+    with _stats_lock:
+        return {use_case: dict(stats) for use_case, stats in projection_stats.items()}
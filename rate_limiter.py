@@ -0,0 +1,145 @@
+"""Token-bucket rate limiting for RapidAPI hosts.
+
+Each host gets its own bucket configured from env, i.e for zillow-com1.p.rapidapi.com:
+    RAPIDAPI_RATE_ZILLOW_COM1=2      # requests per second
+    RAPIDAPI_BURST_ZILLOW_COM1=2     # bucket capacity
+Calls are delayed only when the bucket is empty, 429 responses block the bucket
+for Retry-After seconds and are retried with jittered exponential backoff.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlparse
+
+import requests
+
+DEFAULT_RATE = float(os.getenv("RAPIDAPI_RATE_DEFAULT", 1.0))
+DEFAULT_BURST = float(os.getenv("RAPIDAPI_BURST_DEFAULT", 2))
+MAX_RETRIES = int(os.getenv("RAPIDAPI_MAX_RETRIES", 3))
+BACKOFF_BASE = float(os.getenv("RAPIDAPI_BACKOFF_BASE", 1.0))
+BACKOFF_MAX = float(os.getenv("RAPIDAPI_BACKOFF_MAX", 30.0))
+
+
+class TokenBucket:
+    """Thread-safe token bucket usable from both sync and async code.
+
+    Tokens are reserved under a lock and the caller then waits outside of it,
+    so waiting never blocks other threads and async callers don't block the event loop.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.waits = 0
+        self.waited_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take one token and return number of seconds caller has to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            # updated_at is in the future while blocked, no tokens are added until the block ends
+            self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated_at) * self.rate)
+            self.updated_at = max(now, self.updated_at)
+            self.tokens -= 1
+            wait = max(0.0, self.updated_at - now + max(0.0, -self.tokens) / self.rate)
+            if wait > 0:
+                self.waits += 1
+                self.waited_seconds += wait
+            return wait
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def block_for(self, seconds: float):
+        """Stop handing out tokens for given time, i.e after 429 from upstream.
+
+        Refill restarts when the block ends with at most one token, so callers waiting for
+        the block are spaced out at the configured rate instead of firing together.
+        """
+        with self._lock:
+            self.updated_at = max(self.updated_at, time.monotonic() + seconds)
+            self.tokens = min(self.tokens, 1.0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "capacity": self.capacity,
+                "waits": self.waits,
+                "waited_seconds": round(self.waited_seconds, 3),
+            }
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def _env_suffix(host: str) -> str:
+    """zillow-com1.p.rapidapi.com -> ZILLOW_COM1"""
+    return host.split(".")[0].upper().replace("-", "_")
+
+
+def get_limiter(host: str) -> TokenBucket:
+    """Return shared bucket of given RapidAPI host, creating it from env on first use."""
+    with _buckets_lock:
+        if host not in _buckets:
+            suffix = _env_suffix(host)
+            rate = float(os.getenv(f"RAPIDAPI_RATE_{suffix}", DEFAULT_RATE))
+            capacity = float(os.getenv(f"RAPIDAPI_BURST_{suffix}", DEFAULT_BURST))
+            _buckets[host] = TokenBucket(rate, capacity)
+        return _buckets[host]
+
+
+def limiter_stats() -> dict:
+    with _buckets_lock:
+        return {host: bucket.stats() for host, bucket in _buckets.items()}
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Seconds to wait before retry number ``attempt`` (starting from 0), honoring Retry-After."""
+    if retry_after:
+        try:
+            return float(retry_after) + random.uniform(0, BACKOFF_BASE)
+        except ValueError:
+            pass
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+    # full jitter, so that concurrent requests don't retry at the same moment
+    return random.uniform(delay / 2, delay)
+
+
+def _host_of(url: str, headers: Optional[dict]) -> str:
+    if headers and headers.get("X-RapidAPI-Host"):
+        return headers["X-RapidAPI-Host"]
+    return urlparse(url).netloc
+
+
+def rapidapi_request(method: str, url: str, headers: Optional[dict] = None, **kwargs) -> requests.Response:
+    """requests.request wrapper that waits for the host's rate limit and retries on 429."""
+    limiter = get_limiter(_host_of(url, headers))
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire()
+        response = requests.request(method, url, headers=headers, **kwargs)
+        if response.status_code != 429 or attempt == MAX_RETRIES:
+            return response
+        delay = backoff_delay(attempt, response.headers.get("Retry-After"))
+        print(f"RATE_LIMITED by {url}, retrying in {delay:.2f}s")
+        limiter.block_for(delay)
+    return response
+
+
+def rapidapi_get(url: str, headers: Optional[dict] = None, params: Optional[dict] = None, **kwargs) -> requests.Response:
+    return rapidapi_request("GET", url, headers=headers, params=params, **kwargs)
@@ -4,7 +4,7 @@ from openai import OpenAI
 
 client = OpenAI()
 from typing import Optional
-import requests
+from rate_limiter import rapidapi_get, rapidapi_request
 
 
 functions = [
@@ -64,7 +64,7 @@ def find_property_id(
     querystring = {"input": location}
 
     print(f'Search with {querystring}')
-    result = requests.get(base_url, params=querystring, headers=headers)
+    result = rapidapi_get(base_url, params=querystring, headers=headers)
 
     try:
         property_id = result.json()["autocomplete"][0]["_id"].split(":")[1]
@@ -117,7 +117,7 @@ def __get_info_about_home_from_realtor(location: str):
     else:
         raise Exception("Didn't get p_id")
 
-    result = requests.get(base_url, params=querystring, headers=headers)
+    result = rapidapi_get(base_url, params=querystring, headers=headers)
     print("RESULT_HOME: ", result.json())
     return result
 
@@ -214,7 +214,7 @@ def realtor_search_properties_without_address(user_input: str):
         "X-RapidAPI-Key": os.getenv("X-RapidAPI-Key"),
         "X-RapidAPI-Host": "realtor-com4.p.rapidapi.com"
     }
-    response = requests.post(base_url, json=payload, headers=headers)
+    response = rapidapi_request("POST", base_url, json=payload, headers=headers)
     result = response.json()
     print("RESULT: ", result)
     result = result["data"]["home_search"]["properties"][:5]
@@ -0,0 +1,67 @@
+"""Per-contact registry of in-flight agent runs.
+
+A new message of a contact supersedes (cancels) only that contact's older run,
+runs of other contacts keep going. Finished tasks remove themselves.
+"""
+
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Coroutine, Optional
+
+
+class TaskRegistry:
+    """contact key -> running asyncio task.
+
+    Args:
+        max_size (int): Max number of tracked contacts. When exceeded the oldest run is
+            forgotten (not cancelled), so memory stays bounded under any traffic
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._tasks = OrderedDict()
+        self.metrics = {"started": 0, "superseded": 0, "evicted": 0}
+
+    def start(self, key: Optional[str], coro: Coroutine) -> asyncio.Task:
+        """Run coro as the current task of the contact, cancelling the previous one"""
+        task = asyncio.create_task(coro)
+        self.metrics["started"] += 1
+        if not key:
+            return task
+        previous = self._tasks.pop(key, None)
+        if previous is not None and not previous.done():
+            previous.cancel()
+            self.metrics["superseded"] += 1
+            print(f"TASK_SUPERSEDED for contact {key}")
+        self._tasks[key] = task
+        task.add_done_callback(lambda finished: self._forget(key, finished))
+        while len(self._tasks) > self.max_size:
+            self._tasks.popitem(last=False)
+            self.metrics["evicted"] += 1
+        return task
+
+    def _forget(self, key: str, task: asyncio.Task):
+        # a newer run of the contact may have replaced this one already
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+    def stats(self) -> dict:
+        stats = dict(self.metrics)
+        stats["in_flight"] = len(self._tasks)
+        return stats
+
+
+def contact_key(res: dict) -> Optional[str]:
+    """Identify contact of the GHL request by contact_id, falling back to phone or email"""
+    contact_id = (res.get("customData") or {}).get("contact_id")
+    if contact_id:
+        return f"contact:{contact_id}"
+    if res.get("phone"):
+        return f"phone:{res['phone']}"
+    if res.get("email"):
+        return f"email:{res['email'].strip().lower()}"
+    return None
+
+
+agent_tasks = TaskRegistry(max_size=int(os.getenv("AGENT_TASKS_MAX_CONTACTS", 10000)))
@@ -0,0 +1,87 @@
+"""Token counting and clipping of conversation context to a token budget.
+
+Uses tiktoken when it is installed, otherwise an approximation of 4 characters
+per token, which is close for English text with OpenAI tokenizers.
+"""
+
+import functools
+import os
+from typing import List
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+MAX_CONTEXT_TOKENS = int(os.getenv("MAX_CONTEXT_TOKENS", 4000))
+TOKENIZER_MODEL = "gpt-4o-mini"
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+if tiktoken is not None:
+    try:
+        _encoding = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+    except KeyError:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+
+
+# only short texts (chat messages) are memoized, so the cache never holds whole documents
+CACHED_TEXT_LENGTH = 2048
+
+
+def _count(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+_cached_count = functools.lru_cache(maxsize=4096)(_count)
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if len(text) < CACHED_TEXT_LENGTH:
+        return _cached_count(text)
+    return _count(text)
+
+
+def message_tokens(message) -> int:
+    return count_tokens(message.content)
+
+
+def payload_size(value) -> tuple:
+    """(bytes, tokens) of value as it is put into prompts (str of the object)"""
+    text = str(value)
+    return len(text.encode()), count_tokens(text)
+
+
+def clip_messages(messages: List, budget: int = MAX_CONTEXT_TOKENS) -> int:
+    """
+    Drop oldest messages in place until the rest fits into budget tokens.
+
+    Every message is counted once and the running total is reduced while walking from
+    the start, the cut is made with a single slice deletion. If the cut leaves an AI
+    reply without its question, the reply is dropped too.
+
+    return (int) - number of dropped messages
+    """
+    total = sum(message_tokens(message) for message in messages)
+    cut = 0
+    while total > budget and cut < len(messages):
+        total -= message_tokens(messages[cut])
+        cut += 1
+    if cut:
+        while cut < len(messages) and getattr(messages[cut], "type", None) == "ai":
+            cut += 1
+        del messages[:cut]
+    return cut
+
+
+def clip_text(text: str, budget: int = MAX_CONTEXT_TOKENS) -> str:
+    """Beginning of text that fits into budget tokens"""
+    if count_tokens(text) <= budget:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text)[:budget])
+    return text[:budget * CHARS_PER_TOKEN]
@@ -1,9 +1,13 @@
+import json
+
 import streamlit as st
 
 # from ai_model import Model
 from ai_model import Model
 import requests
 
+API_URL = "http://127.0.0.1:8000"
+
 
 @st.cache_resource()  # Set allow_output_mutation to True for classes
 def get_my_class_instance():
@@ -20,20 +24,52 @@ def get_bot_response(user_input):
     # Replace the following line with your actual chatbot logic
     # response = chatmodel.response(user_input)
     response = requests.post(
-        "http://127.0.0.1:8000/send_message_to_ai",
+        f"{API_URL}/send_message_to_ai",
         json={"customData": {"message": user_input}},
     ).json()
     return response
 
 
+def stream_bot_response(user_input, address, progress=True):
+    """Yield SSE events of /send_message_to_ai/stream as dicts"""
+    with requests.post(
+        f"{API_URL}/send_message_to_ai/stream",
+        params={"progress": str(progress).lower()},
+        json={"customData": {"message": user_input, "address": address, "contact_name": "User"}},
+        stream=True,
+    ) as response:
+        if not response.headers.get("content-type", "").startswith("text/event-stream"):
+            # i.e address is missing
+            yield {"event": "done", "text": response.json().get("prompt", "")}
+            return
+        for line in response.iter_lines(decode_unicode=True):
+            if line and line.startswith("data: "):
+                yield json.loads(line[len("data: "):])
+
+
 def main():
     st.title("Chatbot Template")
 
+    address = st.text_input("Address:", "")
     user_input = st.text_input("You:", "")
 
     if st.button("Send"):
-        bot_response = get_bot_response(user_input)
-        st.text_area("Bot:", bot_response)
+        status = st.empty()
+        answer = st.empty()
+        text = ""
+        for event in stream_bot_response(user_input, address):
+            if event["event"] == "tool":
+                status.caption(f"Using {event['tool']}...")
+            elif event["event"] == "token":
+                text += event["text"]
+                answer.markdown(text)
+            elif event["event"] == "error":
+                status.empty()
+                st.error(f"Something went wrong: {event.get('message', '')}")
+                return
+            elif event["event"] == "done":
+                status.empty()
+                answer.markdown(event["text"])
 
 
 if __name__ == "__main__":
@@ -1,6 +1,9 @@
+import math
 import re
-from ai_model import google_places_wrapper
-import googlemaps
+import threading
+from custom_google_places import CustomGooglePlacesAPIWrapper
+from distance_service import distances_from, is_found, display_distance
+from geocoder import geocode
 import os
 from dotenv import load_dotenv
 from googleplaces import GooglePlaces, types, lang
@@ -11,6 +14,13 @@ load_dotenv()
 # Read an environment variable
 os.environ["GPLACES_API_KEY"] =  os.getenv('GPLACES_API_KEY')
 
+# Nearby places further than this from the house are not offered
+MAX_NEARBY_RADIUS_KM = float(os.getenv("MAX_NEARBY_RADIUS_KM", 32))
+
+# Google Places requests consumed by get_nearby_places
+places_call_stats = {"queries": 0, "places_calls": 0, "fallback_queries": 0, "max_calls_per_query": 0}
+_places_stats_lock = threading.Lock()
+
 def add_distance_to_google_places(res: str,address:str) -> str: 
     """
     res (str) - output of google places wrapper
@@ -22,72 +32,100 @@ def add_distance_to_google_places(res: str,address:str) -> str:
 
     # Finding all matches
     addresses = re.findall(pattern, res)
-    distance_results = []
-    # Searching distance
-    for address_in_res in addresses:
-        distance_results.append(calculate_distance_between_addresses(address_in_res,address))
+    # Searching distance from the house to all places with one Distance Matrix request
+    distance_results = [describe_distance(result) for result in distances_from(address, addresses)] if addresses else []
 
     distance_results_str = '\n'.join(distance_results)
     return res + '\n' + distance_results_str
 
-def calculate_distance_between_addresses(address1 : str, address2 : str):
-        gmaps = googlemaps.Client(key = os.getenv('GPLACES_API_KEY'))
-        data = gmaps.distance_matrix(address1,address2)
-        my_dist =data['rows'][0]['elements'][0]
-        if my_dist['status'] == 'NOT_FOUND':
+def describe_distance(my_dist: dict) -> str:
+        """Format single distances_from result for the prompt"""
+        if not is_found(my_dist):
             return "Sorry, couldn't find the distance"
-        if not my_dist.get("distance"):
-            return "Sorry, couldn't find the distance"
-        distance_km = my_dist['distance']['text']
-        if distance_km == "1 m":
-            distance_km = 'less than 200 m'
-        duration = my_dist['duration']['text']
-        if data['destination_addresses'][0] == data['origin_addresses'][0]:
+        distance_km = display_distance(my_dist)
+        duration = my_dist['duration_text']
+        if my_dist['destination_address'] == my_dist['origin_address']:
             return "Ask about name of the location that user interested in"
-        print(f"Distance from {data['destination_addresses'][0]} to {data['origin_addresses'][0]} is {distance_km} and the car travel time is {duration}")
-        res = f"Include this information while answering, \n The car travel time from {data['destination_addresses'][0]} to {data['origin_addresses'][0]} is {duration}"
+        print(f"Distance from {my_dist['origin_address']} to {my_dist['destination_address']} is {distance_km} and the car travel time is {duration}")
+        res = f"Include this information while answering, \n The car travel time from {my_dist['origin_address']} to {my_dist['destination_address']} is {duration}"
         return res
 
+def calculate_distance_between_addresses(address1 : str, address2 : str):
+        return describe_distance(distances_from(address2, [address1])[0])
+
+def _distance_km(lat_lng: dict, place: dict) -> float:
+    """Great-circle distance between lat_lng and a nearby search result"""
+    location = place.get("geometry", {}).get("location")
+    if not lat_lng or not location:
+        return 0.0
+    lat1, lng1 = math.radians(lat_lng["lat"]), math.radians(lat_lng["lng"])
+    lat2, lng2 = math.radians(location["lat"]), math.radians(location["lng"])
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 6371 * 2 * math.asin(math.sqrt(a))
+
+
+def _record_places_calls(keyword: str, address: str, calls: int, fallback: bool):
+    with _places_stats_lock:
+        places_call_stats["queries"] += 1
+        places_call_stats["places_calls"] += calls
+        places_call_stats["fallback_queries"] += int(fallback)
+        places_call_stats["max_calls_per_query"] = max(places_call_stats["max_calls_per_query"], calls)
+    print(f"PLACES_CALLS for '{keyword}' near {address}: {calls}{' (fallback used)' if fallback else ''}")
+
+
 def get_nearby_places(keyword : str, address: str):
     """
     Google maps nearby search.
 
+    One nearby search ranked by distance returns the closest matches (up to 20),
+    results further than MAX_NEARBY_RADIUS_KM are dropped. Text search fallback
+    is used only if nothing was found.
+
     keyword (str) : place that is searched, i.e school, hospital, dunkin 
     address (str) : address where place from keyword is searched
     """
     google_places = GooglePlaces(os.getenv('GPLACES_API_KEY'))
-    # start with a small radius before making the the radius
-    radius = 2  # Initial radius value
-    max_radius = 32  # Maximum radius value
+    # coordinates from the geocode cache, so nearby_search doesn't geocode the address again
+    coordinates = geocode(address)
+    lat_lng = {"lat": coordinates["lat"], "lng": coordinates["lng"]} if coordinates else None
+    # without coordinates the library geocodes the address itself, that's one more request
+    calls = 1 if lat_lng else 2
     response = ""
 
-    while radius <= max_radius:
-        query_result = google_places.nearby_search(
-            location=address, keyword=keyword,
-            radius=radius * 1000, rankby='distance')  # Convert radius to meters, add rankby parameter = distance
-
-        if len(query_result.raw_response['results']) > 0:
-            sorted_results = sorted(query_result.raw_response['results'], key=lambda x: x.get('distance', float('inf')))
-            for i in range(min(len(sorted_results), 3)):
-                place = f""" {i + 1}. {sorted_results[i]['name']}
-                Address: {sorted_results[i]['vicinity']}
+    # radius is not used with rankby=distance, so a single query replaces widening the radius
+    query_result = google_places.nearby_search(
+        location=address, lat_lng=lat_lng, keyword=keyword, rankby='distance')
+    results = [
+        place for place in query_result.raw_response['results']
+        if _distance_km(lat_lng, place) <= MAX_NEARBY_RADIUS_KM
+    ]
+    for i in range(min(len(results), 3)):
+        place = f""" {i + 1}. {results[i]['name']}
+                Address: {results[i]['vicinity']}
                 """
-                print(f'Found several places {place}')
-                response += place
-            break  # Exit loop if places are found within current radius
-        else:
-            print(f"No places found within {radius} m radius")
-            # Fallback option
-            result = google_places_wrapper(f"{keyword} near {address}")
-
-            if 'Google Places did not find any places that match the description' in result:
-                print(f"fallback option didn't find any results")
-                raise Exception("Couldn't find %s near %s" % (keyword,address))
-            
-            radius += 5  # Increment radius if no places are found
-
-    if not response:
-        print(f"No nearby places found for {keyword} near {address}")
-        raise Exception("Couldn't find %s near %s" % (keyword, address))
-
-    return response
\ No newline at end of file
+        print(f'Found several places {place}')
+        response += place
+
+    if response:
+        _record_places_calls(keyword, address, calls, fallback=False)
+        return response
+
+    print(f"No places found within {MAX_NEARBY_RADIUS_KM} km")
+    # Fallback option
+    places_tool = CustomGooglePlacesAPIWrapper(top_k_results=3)
+    result = places_tool.run(f"{keyword} near {address}")
+    _record_places_calls(keyword, address, calls + places_tool.api_calls, fallback=True)
+    print(f"Google places result : {result}")
+
+    if 'Google Places did not find any places that match the description' in result:
+        print(f"fallback option didn't find any results")
+        raise Exception("Couldn't find %s near %s" % (keyword,address))
+
+    return result
+
+
+def places_stats() -> dict:
+    with _places_stats_lock:
+        stats = dict(places_call_stats)
+    stats["avg_calls_per_query"] = round(stats["places_calls"] / stats["queries"], 2) if stats["queries"] else 0.0
+    return stats
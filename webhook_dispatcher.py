@@ -0,0 +1,171 @@
+"""Background delivery of outbound webhooks (Make.com / GHL inbound webhooks).
+
+Endpoints enqueue the payload and return immediately, worker tasks POST it using
+one pooled aiohttp session, retry failures with backoff and append payloads that
+still could not be delivered to a dead-letter file (JSON lines).
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime
+from typing import Optional
+
+import aiohttp
+import requests
+
+MAKE_WEBHOOK_URL = os.getenv("MAKE_WEBHOOK_URL", "https://hook.us1.make.com/shkla22h4n5o0teeqvwl4x7lcoy977vs")
+GHL_SUMMARY_WEBHOOK_URL = os.getenv(
+    "GHL_SUMMARY_WEBHOOK_URL",
+    "https://services.leadconnectorhq.com/hooks/Cr4I5rLHxAhYI19SvpP6/webhook-trigger/f15fe780-1831-47de-8bfd-9241b8ac626c",
+)
+
+
+class WebhookDispatcher:
+    """Queue of outbound webhook deliveries processed by background worker tasks.
+
+    Args:
+        workers (int): Number of concurrent delivery tasks
+        max_retries (int): Retries after the first failed attempt
+        queue_size (int): Max number of pending deliveries, further ones go to dead-letter file
+        dead_letter_path (str): JSON lines file for deliveries that failed all attempts
+        timeout (float): Timeout of single POST in seconds
+    """
+
+    def __init__(self, workers: int = 4, max_retries: int = 3, queue_size: int = 1000,
+                 dead_letter_path: str = "webhook_dead_letter.jsonl", timeout: float = 15):
+        self.workers = workers
+        self.max_retries = max_retries
+        self.queue_size = queue_size
+        self.dead_letter_path = dead_letter_path
+        self.timeout = timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._tasks = []
+        self._loop = None
+        self.metrics = {
+            "enqueued": 0,
+            "delivered": 0,
+            "retries": 0,
+            "failed_attempts": 0,
+            "dead_lettered": 0,
+            "total_latency_seconds": 0.0,
+            "max_latency_seconds": 0.0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.workers * 2),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, drain_timeout: float = 10):
+        """Wait up to ``drain_timeout`` seconds for pending deliveries, then stop workers."""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"WEBHOOK_DISPATCHER: {self._queue.qsize()} deliveries not finished before shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._session.close()
+
+    def enqueue(self, url: str, payload: dict):
+        """Schedule delivery from the event loop. Falls back to blocking POST if dispatcher isn't running."""
+        if not self.running:
+            self._post_now(url, payload)
+            return
+        self.metrics["enqueued"] += 1
+        try:
+            self._queue.put_nowait((url, payload, time.monotonic()))
+        except asyncio.QueueFull:
+            self._dead_letter(url, payload, "queue is full")
+
+    def enqueue_threadsafe(self, url: str, payload: dict):
+        """Schedule delivery from a worker thread, i.e from LangChain tools."""
+        if not self.running:
+            self._post_now(url, payload)
+            return
+        self._loop.call_soon_threadsafe(self.enqueue, url, payload)
+
+    def _post_now(self, url: str, payload: dict):
+        try:
+            requests.post(url, json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            self._dead_letter(url, payload, str(e))
+
+    async def _worker(self):
+        while True:
+            url, payload, enqueued_at = await self._queue.get()
+            try:
+                await self._deliver(url, payload, enqueued_at)
+            except Exception as e:
+                self._dead_letter(url, payload, f"unexpected error: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, url: str, payload: dict, enqueued_at: float):
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.metrics["retries"] += 1
+                delay = min(30.0, 2 ** attempt)
+                await asyncio.sleep(random.uniform(delay / 2, delay))
+            try:
+                async with self._session.post(url, json=payload) as response:
+                    if response.status < 500 and response.status != 429:
+                        if response.status >= 400:
+                            # client errors won't be fixed by retrying
+                            self._dead_letter(url, payload, f"HTTP {response.status}: {await response.text()}")
+                        else:
+                            self._record_latency(enqueued_at)
+                        return
+                    error = f"HTTP {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+            self.metrics["failed_attempts"] += 1
+        self._dead_letter(url, payload, error)
+
+    def _record_latency(self, enqueued_at: float):
+        latency = time.monotonic() - enqueued_at
+        self.metrics["delivered"] += 1
+        self.metrics["total_latency_seconds"] += latency
+        self.metrics["max_latency_seconds"] = max(self.metrics["max_latency_seconds"], latency)
+
+    def _dead_letter(self, url: str, payload: dict, error: str):
+        self.metrics["dead_lettered"] += 1
+        print(f"WEBHOOK_DELIVERY_FAILED {url}: {error}")
+        record = {"time": datetime.now().isoformat(), "url": url, "payload": payload, "error": error}
+        with open(self.dead_letter_path, "a") as file:
+            file.write(json.dumps(record, default=str) + "\n")
+
+    def stats(self) -> dict:
+        stats = dict(self.metrics)
+        delivered = stats["delivered"]
+        stats["avg_latency_seconds"] = round(stats["total_latency_seconds"] / delivered, 4) if delivered else 0.0
+        stats["total_latency_seconds"] = round(stats["total_latency_seconds"], 3)
+        stats["max_latency_seconds"] = round(stats["max_latency_seconds"], 3)
+        stats["queue_depth"] = self._queue.qsize() if self._queue is not None else 0
+        return stats
+
+
+webhook_dispatcher = WebhookDispatcher(
+    workers=int(os.getenv("WEBHOOK_WORKERS", 4)),
+    max_retries=int(os.getenv("WEBHOOK_MAX_RETRIES", 3)),
+    queue_size=int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000)),
+    dead_letter_path=os.getenv("WEBHOOK_DEAD_LETTER_PATH", "webhook_dead_letter.jsonl"),
+)
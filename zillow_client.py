@@ -0,0 +1,82 @@
+"""Async Zillow (zillow-com1 on RapidAPI) client built on a pooled aiohttp session.
+
+Used by the async variants of the tools in ai_model.py, so FastAPI handlers
+can await Zillow calls instead of blocking the event loop with requests.get.
+"""
+
+import asyncio
+import os
+from typing import Any, Optional, Tuple
+
+import aiohttp
+
+from rate_limiter import get_limiter, backoff_delay, MAX_RETRIES
+
+ZILLOW_HOST = "zillow-com1.p.rapidapi.com"
+
+
+class AsyncZillowClient:
+    """Zillow api client that reuses one aiohttp session (connection pool) per event loop.
+
+    Args:
+        host (str): RapidAPI host
+        pool_size (int): Max number of simultaneous connections to the host
+        timeout (float): Total timeout of single request in seconds
+    """
+
+    def __init__(self, host: str = ZILLOW_HOST, pool_size: int = 20, timeout: float = 30):
+        self.host = host
+        self.base_url = f"https://{host}"
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.limiter = get_limiter(host)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop = None
+
+    @property
+    def headers(self) -> dict:
+        return {
+            "X-RapidAPI-Key": os.getenv("X-RapidAPI-Key", ""),
+            "X-RapidAPI-Host": self.host,
+        }
+
+    async def session(self) -> aiohttp.ClientSession:
+        """Return shared session, creating it lazily inside the running loop."""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._loop = loop
+        return self._session
+
+    async def get(self, path: str, params: Optional[dict] = None) -> Tuple[int, Any]:
+        """
+        GET ``path`` of Zillow api respecting host rate limit and retrying on 429.
+
+        return (Tuple[int, Any]) - status code and decoded JSON (or text if body is not JSON)
+        """
+        params = {key: str(value) for key, value in (params or {}).items()}
+        session = await self.session()
+        for attempt in range(MAX_RETRIES + 1):
+            await self.limiter.acquire_async()
+            async with session.get(f"{self.base_url}/{path}", params=params, headers=self.headers) as response:
+                if response.status == 429 and attempt < MAX_RETRIES:
+                    delay = backoff_delay(attempt, response.headers.get("Retry-After"))
+                    print(f"RATE_LIMITED by {path}, retrying in {delay:.2f}s")
+                    self.limiter.block_for(delay)
+                    continue
+                try:
+                    data = await response.json(content_type=None)
+                except ValueError:
+                    data = await response.text()
+                return response.status, data
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+zillow_client = AsyncZillowClient(pool_size=int(os.getenv("ZILLOW_POOL_SIZE", 20)))